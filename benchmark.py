@@ -0,0 +1,249 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""
+Headless benchmark of PonyRig's hot paths, runs without a GPU:
+
+    blender -b --factory-startup --python benchmark.py -- --output bench.json
+
+or with the bpy module:
+
+    python benchmark.py --output bench.json
+
+A synthetic armature is generated with the bone names in 'bone_affect', the 'properties' bone
+and the 'bone_collections' layout, so no production file is needed.
+"""
+
+import argparse, importlib, json, os, statistics, sys, time
+
+import bpy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ponyrig
+
+
+def parse_args() -> argparse.Namespace:
+    argv = sys.argv[sys.argv.index("--")+1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(description="Benchmark PonyRig hot paths")
+    parser.add_argument("--output", help="Write results as JSON into this file, stdout if omitted")
+    parser.add_argument("--objects", type=int, default=2000, help="Number of filler objects in the scene")
+    parser.add_argument("--bones", type=int, default=300, help="Minimum number of bones of the synthetic rig")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions of fast measurements")
+    parser.add_argument("--frames", type=int, nargs="+", default=[1, 100, 1000], help="Frame counts of Snap & Bake")
+
+    return parser.parse_args(argv)
+
+
+"""Custom properties of the synthetic rig: prop owner -> {prop name: value}"""
+synthetic_properties = {
+    **{owner: {"FK/IK": 1.0} for owner in ponyrig.prop_limbs + ponyrig.prop_hairs},
+    'properties': {"Quality": 1, "head_hinge": 0.0, "eye_target_parents": 0},
+    'tail_options': {"FK/IK": 1.0, "tail_hinge": 0.0},
+    'L_lipCorner_ctrl': {"L_zipper_lip": 0.0},
+    'R_lipCorner_ctrl': {"R_zipper_lip": 0.0},
+    'jaw_ctrl': {"jaw_influence": 0.5},
+    'magic_ctrl': {prop: 0.5 for props in ponyrig.magic_props for prop in props},
+}
+
+
+def create_synthetic_rig(bone_count:int) -> bpy.types.Object:
+    """Create an armature with the bone names, properties and collections PonyRig expects"""
+
+    armature = bpy.data.armatures.new("ponyrig_bench")
+    rig = bpy.data.objects.new("ponyrig_bench", armature)
+    rig[ponyrig.RIG_ID] = True
+    bpy.context.scene.collection.objects.link(rig)
+    bpy.context.view_layer.objects.active = rig
+
+    bpy.ops.object.mode_set(mode='EDIT')
+    edit_bones = armature.edit_bones
+
+    def new_bone(name:str, parent=None, offset=0.0):
+        bone = edit_bones.new(name)
+        bone.head = (offset, 0.0, 0.0) if parent is None else parent.tail
+        bone.tail = (bone.head[0], 0.0, bone.head[2] + 0.1)
+        bone.parent = parent
+        return bone
+
+    root = new_bone("root")
+    new_bone("properties", root)
+    for owner in synthetic_properties:
+        if owner not in edit_bones:
+            new_bone(owner, root)
+    for chain_index, bones in enumerate(ponyrig.bone_affect.values()):
+        parent = root
+        for bone_name in bones:
+            if bone_name not in edit_bones:
+                parent = new_bone(bone_name, parent, offset=chain_index)
+    for bone_name in ('head_ctrl', 'tailBase_bndJnt1_FK'):
+        if bone_name not in edit_bones:
+            new_bone(bone_name, root)
+
+    filler_index = 0
+    while len(edit_bones) < bone_count:
+        new_bone(f"filler_{filler_index:03}", root, offset=filler_index * 0.01)
+        filler_index += 1
+
+    bpy.ops.object.mode_set(mode='POSE')
+
+    for owner, props in synthetic_properties.items():
+        for prop, value in props.items():
+            rig.pose.bones[owner][prop] = value
+
+    """Spread the bones over the expected bone collections"""
+    collections = [armature.collections.new(name) for name in ponyrig.bone_collections]
+    for i, bone in enumerate(armature.bones):
+        collections[i % len(collections)].assign(bone)
+        if i % 7 == 0:
+            """Bones in several collections"""
+            collections[(i + 1) % len(collections)].assign(bone)
+
+    return rig
+
+
+def create_scene(object_count:int):
+    """Add tagged magic and outline collections and filler objects"""
+
+    scene = bpy.context.scene
+    for tag in ('magic_master', 'outline_master'):
+        collection = bpy.data.collections.new(tag)
+        collection[tag] = True
+        scene.collection.children.link(collection)
+
+    outline = bpy.data.collections['outline_master']
+    filler = bpy.data.collections.new("filler")
+    scene.collection.children.link(filler)
+
+    for i in range(object_count):
+        obj = bpy.data.objects.new(f"filler_{i:05}", None)
+        (outline if i < 20 else filler).objects.link(obj)
+
+
+class BenchLayout:
+    """Stand-in for UILayout, so panel draw code runs without a window"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls += 1
+            return self
+        return call
+
+
+def get_panel_stub(panel_cls):
+    """Plain Python object with the panel's methods, bpy Panel subclasses can't be instantiated"""
+
+    namespace = {}
+    for cls in reversed(panel_cls.__mro__):
+        if cls.__module__ == ponyrig.__name__:
+            namespace.update(vars(cls))
+    namespace.pop('__dict__', None)
+    namespace.pop('__weakref__', None)
+
+    stub = type(panel_cls.__name__, (), namespace)()
+    stub.layout = BenchLayout()
+    return stub
+
+
+def measure(name:str, func, repeat:int, setup=None, **info) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    result = {
+        "name": name,
+        "repeat": repeat,
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "median": statistics.median(times),
+        **info,
+    }
+    print(f"{name:<40} median {result['median']*1000:10.3f} ms  min {result['min']*1000:10.3f} ms", file=sys.stderr)
+    return result
+
+
+def reset_bake_state(rig:bpy.types.Object):
+    if rig.animation_data:
+        rig.animation_data_clear()
+    for owner in ponyrig.prop_limbs + ponyrig.prop_hairs:
+        rig.pose.bones[owner]["FK/IK"] = 1.0
+
+
+def run(args:argparse.Namespace) -> dict:
+    bpy.ops.wm.read_homefile(use_empty=True)
+    ponyrig.register()
+
+    rig = create_synthetic_rig(args.bones)
+    create_scene(args.objects)
+    context = bpy.context
+    results = []
+
+    """Startup cost in a heavy file: module import, register() and the load_post handler"""
+    ponyrig.unregister()
+    results.append(measure("startup.import", lambda: importlib.reload(ponyrig), args.repeat))
+    results.append(measure("startup.register", ponyrig.register, args.repeat, setup=ponyrig.unregister))
+    results.append(measure("startup.load_post", ponyrig.ponyrig_load_post, args.repeat))
+
+    def cold_get_ponyrig():
+        ponyrig.invalidate_rig_registry()
+        ponyrig.get_ponyrig()
+
+    results.append(measure("get_ponyrig.cold", cold_get_ponyrig, args.repeat))
+    results.append(measure("get_ponyrig.cached", ponyrig.get_ponyrig, args.repeat))
+
+    for panel_cls in ponyrig.classes:
+        if not issubclass(panel_cls, bpy.types.Panel):
+            continue
+        stub = get_panel_stub(panel_cls)
+        results.append(measure(f"draw.{panel_cls.__name__}", lambda: stub.draw(context), args.repeat))
+
+    chain = "mane_options"
+    for frames in args.frames:
+        results.append(measure(
+            f"snap_bake.{chain}.{frames}",
+            lambda: bpy.ops.pose.ponyrig_snap_bake(
+                'EXEC_DEFAULT',
+                do_bake=True, frame_start=1, frame_end=frames,
+                key_before_start=True, key_after_end=True,
+                prop_owner_name=chain, prop_name="FK/IK",
+                affect_bones=repr(ponyrig.bone_affect[chain]),
+            ),
+            repeat=1 if frames >= 1000 else 3,
+            setup=lambda: reset_bake_state(rig),
+            frames=frames,
+        ))
+
+    results.append(measure(
+        "keyframe_all.current",
+        lambda: bpy.ops.pose.ponyrig_keyframe_all_ctrl_bones('EXEC_DEFAULT'),
+        args.repeat,
+        setup=lambda: reset_bake_state(rig),
+    ))
+    results.append(measure("reset.all", lambda: bpy.ops.pose.ponyrig_rest('EXEC_DEFAULT'), args.repeat))
+
+    return {
+        "blender": bpy.app.version_string,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scene": {"objects": len(bpy.data.objects), "bones": len(rig.pose.bones)},
+        "results": results,
+    }
+
+
+def main():
+    args = parse_args()
+    report = json.dumps(run(args), indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,13 @@ bl_info = {
 }
 
 
-import bpy, re, ast
+import bpy, ast, json, math, os, time
+from collections import deque
+from contextlib import ExitStack, contextmanager, nullcontext
+from fnmatch import fnmatchcase
+from functools import wraps
+import numpy as np
+from bpy.app.handlers import persistent
 from bpy.types import (
     PropertyGroup,
     Collection,
@@ -24,13 +30,20 @@ from bpy.types import (
     Object,
     UILayout,
     Operator,
+    Scene,
+    WindowManager,
 )
+from bpy_extras.io_utils import ExportHelper, ImportHelper
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Matrix, Quaternion, Vector
 from bpy.props import (
     PointerProperty,
     StringProperty,
     IntProperty,
+    FloatProperty,
     BoolProperty,
     CollectionProperty,
+    EnumProperty,
 )
 
 
@@ -69,51 +82,1800 @@ bone_affect = {
                     [f"mane0{i}End_IK1" for i in range(1, 5)],
     "tail_options": ["tailBase_bndJnt1_FK"]+[f"tail_bndJnt{i}_FK" for i in range(1,10)],
 }
+"""
+IK controls placed from the FK chain when snapping FK to IK: prop bone -> settings.
+'targets' maps IK controls to the FK bone they follow, keeping their rest offset to it.
+'pole' is an optional (pole control, upper FK bone, lower FK bone), the pole is placed in the plane of the two FK bones.
+IK control names differ per rig, so they are set in the rig's schema, e.g. for a leg and a hair chain:
+    "L_foreLeg_options": {"targets": {"<leg IK control>": "L_foreLeg_FKJnt4"}, "pole": ["<pole control>", "L_foreLeg_FKJnt1", "L_foreLeg_FKJnt2"]},
+    "tail_options": {"targets": {"<tail IK control>": "tail_bndJnt9_FK"}},
+"""
+ik_snap = {}
+"""Properties of 'magic_ctrl' drawn in the Magic & Outline panel, one tuple per box"""
+magic_props = (
+    ("Points", "Sparkles", "Opacity", "Power"),
+    ("Amplitude", "Frequency", "Speed", "Roughness"),
+)
+
+"""
+Rig layout used by panels and operators, see RigSchema.
+Rigs of other characters store their own layout as a JSON string in the object property 'ponyrig_schema',
+or as a path to a JSON file in 'ponyrig_schema_file'. Keys missing from it are taken from this default.
+"""
+DEFAULT_SCHEMA = {
+    "bone_collections": bone_collections,
+    "prop_limbs": prop_limbs,
+    "prop_hairs": prop_hairs,
+    "bone_alias": bone_alias,
+    "bone_affect": bone_affect,
+    "ik_snap": ik_snap,
+    "hinges": (                 # (prop owner, prop name, affected bone, label)
+        ('properties', 'head_hinge', 'head_ctrl', 'Head'),
+        ('tail_options', 'tail_hinge', 'tailBase_bndJnt1_FK', 'Tail'),
+    ),
+    "eye_target": ('properties', 'eye_target_parents', "Eye Target Parent", ('Master', 'Head', 'COG')),
+    "zippers": (                # (prop owner, prop name, label)
+        ("L_lipCorner_ctrl", "L_zipper_lip", "L Lip Zipper"),
+        ("R_lipCorner_ctrl", "R_zipper_lip", "R Lip Zipper"),
+    ),
+    "jaw": ('jaw_ctrl', 'jaw_influence', "Lip Corner Jaw Influence"),
+    "magic": {"collection": "magic_master", "bone": "magic_ctrl", "props": magic_props},
+    "outline_collection": "outline_master",
+    "quality": ("properties", "Quality"),
+    "keyframe_excluded_collections": ('Rigging',),
+}
+SCHEMA_PROP = "ponyrig_schema"
+SCHEMA_FILE_PROP = "ponyrig_schema_file"
+
+
+class RigSchema:
+    """Rig layout compiled into the lookup tables used by panels and operators, see get_rig_schema()"""
+
+    def __init__(self, data:dict, error:str=""):
+        data = {**DEFAULT_SCHEMA, **data}
+        self.error = error
+
+        self.bone_collections = tuple(data["bone_collections"])
+        self.prop_limbs = tuple(data["prop_limbs"])
+        self.prop_hairs = tuple(data["prop_hairs"])
+        self.bone_alias = dict(data["bone_alias"])
+        self.bone_affect = {owner: list(bones) for owner, bones in data["bone_affect"].items()}
+        self.ik_snap = {
+            owner: (dict(ik["targets"]), tuple(ik["pole"]) if ik.get("pole") else None)
+            for owner, ik in data["ik_snap"].items()
+        }
+        self.hinges = tuple(tuple(hinge) for hinge in data["hinges"])
+        self.eye_target = tuple(data["eye_target"])
+        self.zippers = tuple(tuple(zipper) for zipper in data["zippers"])
+        self.jaw = tuple(data["jaw"])
+        self.magic_collection = data["magic"]["collection"]
+        self.magic_bone = data["magic"]["bone"]
+        self.magic_props = tuple(tuple(props) for props in data["magic"]["props"])
+        self.outline_collection = data["outline_collection"]
+        self.quality = tuple(data["quality"])
+        self.keyframe_excluded_collections = set(data["keyframe_excluded_collections"])
+
+        """bone_affect formatted for the 'affect_bones' property of Snap & Bake"""
+        self.bone_affect_repr = {owner: f"{bones}" for owner, bones in self.bone_affect.items()}
+
+        """Chains which can be snapped: chain id -> (label, prop owner, prop name, affected bones)"""
+        self.snap_chains = {
+            **{owner: (self.bone_alias.get(owner, owner), owner, "FK/IK", bones) for owner, bones in self.bone_affect.items()},
+            **{prop: (f"{label} Hinge", owner, prop, [bone]) for owner, prop, bone, label in self.hinges},
+        }
+        self.snap_chain_items = [(chain_id, label, f"Snap & Bake {label}") for chain_id, (label, *_) in self.snap_chains.items()]
+
+        """Rig custom properties which are restored by Reset Rig, as (prop owner, prop name)"""
+        self.rig_properties = (
+            *((owner, "FK/IK") for owner in self.prop_limbs + self.prop_hairs),
+            *((owner, prop) for owner, prop, *_ in self.hinges),
+            self.eye_target[:2],
+            *((owner, prop) for owner, prop, *_ in self.zippers),
+            self.jaw[:2],
+            *((self.magic_bone, prop) for props in self.magic_props for prop in props),
+        )
+
+
+default_schema = RigSchema({})
+
+"""Compiled schemas by source, rigs sharing a schema share the compiled tables: (source type, text or path) -> RigSchema"""
+_compiled_schemas: dict[tuple[str, str], RigSchema] = {}
+
+
+def compile_rig_schema(rig:Object) -> RigSchema:
+    text = rig.get(SCHEMA_PROP)
+    filepath = rig.get(SCHEMA_FILE_PROP)
+    if text:
+        key = ('PROP', text)
+    elif filepath:
+        key = ('FILE', bpy.path.abspath(filepath, library=rig.library))
+    else:
+        return default_schema
+
+    schema = _compiled_schemas.get(key)
+    if schema is not None:
+        return schema
+
+    try:
+        if key[0] == 'PROP':
+            data = json.loads(text)
+        else:
+            with open(key[1]) as file:
+                data = json.load(file)
+        schema = RigSchema(data)
+    except (OSError, ValueError, TypeError, KeyError, IndexError) as e:
+        schema = RigSchema({}, error=f"Invalid rig schema of '{rig.name}': {e}")
+
+    _compiled_schemas[key] = schema
+    return schema
+
+
+def get_rig_schema(rig:Object) -> RigSchema:
+    """Get the compiled layout of rig, compiled once per schema source"""
+    return get_rig_cache(rig, "schema", compile_rig_schema)
+
+
+class Profiler:
+    """Opt-in instrumentation of panel draw and operator run times, and counts of frequent lookups"""
+
+    history = 120                   # Samples kept per name for the rolling summary
+    trace_size = 10000              # Events kept for the JSON trace
+
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.samples: dict[str, deque] = {}
+        self.counts: dict[str, int] = {}
+        self.trace = deque(maxlen=self.trace_size)
+
+    def count(self, name:str):
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def record(self, name:str, start:float, end:float):
+        self.samples.setdefault(name, deque(maxlen=self.history)).append(end - start)
+        self.trace.append((name, start, end))
+
+    def summary(self) -> list[tuple[str, int, float, float]]:
+        """(name, samples, mean seconds, max seconds) of recent samples, slowest first"""
+
+        rows = [(name, len(times), sum(times) / len(times), max(times)) for name, times in self.samples.items() if times]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def dump(self, filepath:str):
+        """Write recorded events in Chrome trace event format, readable by chrome://tracing and Perfetto"""
+
+        events = [
+            {"name": name, "ph": "X", "pid": 0, "tid": 0, "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6}
+            for name, start, end in self.trace
+        ]
+        with open(filepath, 'w') as file:
+            json.dump({"traceEvents": events, "otherData": {"counts": self.counts}}, file, indent=1)
+
+
+profiler = Profiler()
+
+
+def profiled(func):
+    """
+    Record run time of a draw() or execute() method under its qualified name while profiling is enabled.
+    Wrapper keeps the (self, context) signature, Blender checks the argument count on registration.
+    """
+    name = func.__qualname__
+
+    @wraps(func)
+    def wrapper(self, context):
+        if not profiler.enabled:
+            return func(self, context)
+
+        start = time.perf_counter()
+        try:
+            return func(self, context)
+        finally:
+            profiler.record(name, start, time.perf_counter())
+
+    return wrapper
+
+
+def get_pose_bone(rig:Object, bone_name:str) -> PoseBone | None:
+    if profiler.enabled:
+        profiler.count("pose.bones.get")
+    return rig.pose.bones.get(bone_name)
+
+
+def resolve_property(owner, prop_name:str):
+    """Get custom property value, raises ValueError if it doesn't exist"""
+
+    if profiler.enabled:
+        profiler.count("path_resolve")
+    return owner.path_resolve(f'["{prop_name}"]')
+
+
+"""Cached armatures of each rig_id, see get_ponyrigs()"""
+_rig_registry: dict[str, list[Object]] = {}
+_rig_registry_object_count = -1
+
+
+def is_ponyrig(obj:Object, rig_id:str=RIG_ID) -> bool:
+    """Rigs with their own schema are PonyRigs as well"""
+
+    if obj.type != 'ARMATURE':
+        return False
+    if rig_id == RIG_ID and (SCHEMA_PROP in obj or SCHEMA_FILE_PROP in obj):
+        return True
+    return bool(obj.get(rig_id))
+
+
+def get_ponyrigs(rig_id:str=RIG_ID) -> list[Object]:
+    """Get all armatures with property: rig_id. The result is cached until the registry is invalidated"""
+    global _rig_registry_object_count
+
+    if profiler.enabled:
+        profiler.count("get_ponyrig")
+
+    rigs = _rig_registry.get(rig_id)
+    if rigs is not None:
+        try:
+            if all(is_ponyrig(rig, rig_id) for rig in rigs):
+                return rigs
+        except ReferenceError:
+            """Cached rig was removed"""
+            pass
+
+    rigs = [obj for obj in bpy.data.objects if is_ponyrig(obj, rig_id)]
+    _rig_registry[rig_id] = rigs
+    _rig_registry_object_count = len(bpy.data.objects)
+
+    return rigs
+
+
+def get_ponyrig(rig_id:str=RIG_ID) -> Object | None:
+    """Get ponyrig by searching object with property: rig_id"""
+
+    rigs = get_ponyrigs(rig_id)
+    return rigs[0] if rigs else None
+
+
+def get_active_ponyrig(context:Context, rig_id:str=RIG_ID) -> Object | None:
+    """Get the rig being worked on: the active object, the rig parenting or deforming it, or the first rig in the file"""
+
+    obj = getattr(context, "active_object", None)
+    if obj is not None:
+        if is_ponyrig(obj, rig_id):
+            return obj
+        if obj.parent and is_ponyrig(obj.parent, rig_id):
+            return obj.parent
+        for modifier in obj.modifiers:
+            if modifier.type == 'ARMATURE' and modifier.object and is_ponyrig(modifier.object, rig_id):
+                return modifier.object
+
+    return get_ponyrig(rig_id)
+
+
+def get_selected_ponyrigs(context:Context, rig_id:str=RIG_ID) -> list[Object]:
+    """Get the active rig followed by all other selected rigs"""
+
+    rigs = [obj for obj in context.selected_objects if is_ponyrig(obj, rig_id)]
+    active = get_active_ponyrig(context, rig_id)
+    if active is not None:
+        if active in rigs:
+            rigs.remove(active)
+        rigs.insert(0, active)
+    return rigs
+
+
+def invalidate_rig_registry():
+    _rig_registry.clear()
+
+
+def update_rig_registry(obj:Object):
+    """Add or remove a single object from the cached registry after its properties changed"""
+
+    for rig_id, rigs in _rig_registry.items():
+        if is_ponyrig(obj, rig_id):
+            if obj not in rigs:
+                rigs.append(obj)
+        elif obj in rigs:
+            rigs.remove(obj)
+
+
+"""Custom property tag -> first collection with that tag, see get_tagged_collection()"""
+_collection_index: dict[str, Collection] = {}
+_collection_tags: dict[int, set[str]] = {}
+_collection_index_count = -1
+
+
+def get_collection_tags(collection:Collection) -> set[str]:
+    """Custom properties which are set on the collection"""
+    return {key for key in collection.keys() if collection.get(key)}
+
+
+def build_collection_index():
+    global _collection_index_count
+
+    _collection_index.clear()
+    _collection_tags.clear()
+
+    for collection in bpy.data.collections:
+        tags = get_collection_tags(collection)
+        _collection_tags[collection.session_uid] = tags
+        for tag in tags:
+            _collection_index.setdefault(tag, collection)
+
+    _collection_index_count = len(bpy.data.collections)
+
+
+def invalidate_collection_index():
+    global _collection_index_count
+
+    _collection_index.clear()
+    _collection_tags.clear()
+    _collection_index_count = -1
+
+
+def update_collection_index(collection:Collection):
+    """Re-index a single collection after its properties changed"""
+
+    old_tags = _collection_tags.get(collection.session_uid, set())
+    new_tags = get_collection_tags(collection)
+    _collection_tags[collection.session_uid] = new_tags
+
+    for tag in old_tags - new_tags:
+        if _collection_index.get(tag) == collection:
+            """Another collection may carry the same tag, let next lookup rebuild the index"""
+            invalidate_collection_index()
+            return
+    for tag in new_tags - old_tags:
+        _collection_index.setdefault(tag, collection)
+
+
+def get_tagged_collection(tag:str) -> Collection | None:
+    """Get the first collection with a custom property: tag"""
+
+    if _collection_index_count < 0:
+        build_collection_index()
+
+    collection = _collection_index.get(tag)
+    if collection is None:
+        return None
+
+    try:
+        if collection.get(tag):
+            return collection
+    except ReferenceError:
+        """Cached collection was removed"""
+        pass
+
+    build_collection_index()
+    return _collection_index.get(tag)
+
+
+"""Data derived from a rig, see get_rig_cache(): rig session_uid -> {cache name: data}"""
+_rig_caches: dict[int, dict] = {}
+
+"""Validation key of each rig's caches when they were built: rig session_uid -> key, see get_rig_cache_key()"""
+_rig_cache_keys: dict[int, tuple] = {}
+
+
+def get_rig_cache_key(rig:Object) -> tuple:
+    """
+    Cheap summary of what the per rig caches are built from: the armature, bone and collection names,
+    collection membership, custom property names of the pose bones, rotation modes and the schema.
+    """
+
+    pose_bones = rig.pose.bones
+    rotation_modes = np.empty(len(pose_bones), dtype=np.int32)
+    pose_bones.foreach_get("rotation_mode", rotation_modes)
+    collections = rig.data.collections_all
+    return (
+        rig.data.session_uid,
+        tuple(pose_bones.keys()),
+        tuple(collections.keys()),
+        tuple(len(collection.bones) for collection in collections),
+        tuple(tuple(pose_bone.keys()) for pose_bone in pose_bones),
+        rotation_modes.tobytes(),
+        rig.get(SCHEMA_PROP),
+        rig.get(SCHEMA_FILE_PROP),
+    )
+
+
+def get_rig_cache(rig:Object, name:str, build):
+    """Get data which is built by build(rig) once and kept until the inputs of the rig's caches change"""
+
+    cache = _rig_caches.get(rig.session_uid)
+    if cache is None:
+        cache = _rig_caches[rig.session_uid] = {}
+        _rig_cache_keys[rig.session_uid] = get_rig_cache_key(rig)
+    if name not in cache:
+        cache[name] = build(rig)
+    return cache[name]
+
+
+def invalidate_rig_caches(rig:Object=None):
+    if rig is None:
+        _rig_caches.clear()
+        _rig_cache_keys.clear()
+    else:
+        _rig_caches.pop(rig.session_uid, None)
+        _rig_cache_keys.pop(rig.session_uid, None)
+
+
+def validate_rig_caches(rig:Object):
+    """Drop the rig's caches if the validation key changed since they were built"""
+
+    key = _rig_cache_keys.get(rig.session_uid)
+    if key is not None and key != get_rig_cache_key(rig):
+        invalidate_rig_caches(rig)
+
+
+def get_bone_indices(rig:Object) -> dict[str, int]:
+    """Index of each pose bone in rig.pose.bones, for arrays read by foreach_get()"""
+    return get_rig_cache(rig, "bone_indices", lambda rig: {pose_bone.name: i for i, pose_bone in enumerate(rig.pose.bones)})
+
+
+"""Default values of the schema's rig_properties, captured once per rig: rig session_uid -> {(prop owner, prop name): value}"""
+_rig_property_defaults: dict[int, dict[tuple[str, str], object]] = {}
+
+
+def get_property_defaults(rig:Object) -> dict[tuple[str, str], object]:
+    """Default of each property in the schema's rig_properties. Uses the property's UI default, or its value when first captured"""
+
+    defaults = _rig_property_defaults.get(rig.session_uid)
+    if defaults is not None:
+        return defaults
+
+    defaults = {}
+    for owner_name, prop_name in get_rig_schema(rig).rig_properties:
+        owner = get_pose_bone(rig, owner_name)
+        if owner is None or owner.get(prop_name) is None:
+            continue
+        value = owner[prop_name]
+        try:
+            value = owner.id_properties_ui(prop_name).as_dict().get('default', value)
+        except TypeError:
+            """Property type without UI data"""
+            pass
+        defaults[(owner_name, prop_name)] = value
+
+    _rig_property_defaults[rig.session_uid] = defaults
+    return defaults
+
+
+class PropertyDescriptor:
+    """Resolved owner, data path and value type of a property control, see get_property_descriptor()"""
+
+    __slots__ = ("owner", "data_path", "kind", "error")
+
+    def __init__(self, owner:PoseBone|None, prop_name:str, kind:str, error:str=""):
+        self.owner = owner
+        self.data_path = f'["{prop_name}"]'
+        self.kind = kind                # 'INT', 'FLOAT', 'BOOL' or 'OTHER', decides the widget
+        self.error = error              # Error message if owner or property is missing
+
+
+def build_property_descriptor(rig:Object, prop_owner_name:str, prop_name:str) -> PropertyDescriptor:
+    prop_owner = get_pose_bone(rig, prop_owner_name)
+    if prop_owner is None:
+        return PropertyDescriptor(None, prop_name, 'OTHER', f'Missing property owner: "{prop_owner_name}"')
+    try:
+        prop_value = resolve_property(prop_owner, prop_name) # Property existence check.
+    except ValueError:
+        return PropertyDescriptor(None, prop_name, 'OTHER', f'Missing property: "{prop_name}", owner: "{prop_owner_name}"')
+
+    kind = {int: 'INT', float: 'FLOAT', bool: 'BOOL'}.get(type(prop_value), 'OTHER')
+    return PropertyDescriptor(prop_owner, prop_name, kind)
+
+
+def get_property_descriptor(rig:Object, prop_owner_name:str, prop_name:str) -> PropertyDescriptor:
+    """Get descriptor of a property control, resolved once and kept until the rig changes"""
+
+    descriptors = get_rig_cache(rig, "property_descriptors", lambda rig: {})
+    key = (prop_owner_name, prop_name)
+    descriptor = descriptors.get(key)
+    if descriptor is None:
+        descriptor = descriptors[key] = build_property_descriptor(rig, prop_owner_name, prop_name)
+    return descriptor
+
+
+def draw_bone_property(
+    layout: UILayout,
+    rig: Object,
+    prop_owner_name: str,
+    prop_name: str,
+    slider_name="",
+    texts=[],
+    icon_true="CHECKBOX_HLT",
+    icon_false='CHECKBOX_DEHLT',
+    translate=False
+):
+    descriptor = get_property_descriptor(rig, prop_owner_name, prop_name)
+    if descriptor.error:
+        layout.alert = True
+        layout.label(text=descriptor.error, icon="ERROR")
+        return
+
+    prop_owner, data_path, kind = descriptor.owner, descriptor.data_path, descriptor.kind
+    if len(texts) > 0 and kind == 'INT':
+        text = slider_name + ": " + texts[prop_owner[prop_name]]
+        layout.prop(prop_owner, data_path, text=text, slider=True, translate=translate)
+    elif kind == 'FLOAT':
+        layout.prop(prop_owner, data_path, text=slider_name, slider=True, translate=translate)
+    elif kind == 'BOOL':
+        icon = icon_true if prop_owner[prop_name] else icon_false
+        layout.prop(prop_owner, data_path, text=slider_name, toggle=True, icon=icon, translate=translate)
+    else:
+        layout.prop(prop_owner, data_path, text=slider_name, translate=translate)
+
+
+"""Array length of pose bone transform properties"""
+transform_sizes = {
+    "location": 3,
+    "rotation_quaternion": 4,
+    "rotation_axis_angle": 4,
+    "rotation_euler": 3,
+    "scale": 3,
+}
+
+
+"""Rest value of pose bone transform properties"""
+transform_rest = {
+    "location": (0, 0, 0),
+    "rotation_euler": (0, 0, 0),
+    "rotation_quaternion": (1, 0, 0, 0),
+    "scale": (1, 1, 1),
+}
+
+
+def reset_bone_transforms(rig:Object, bone_names:list[str]|None=None):
+    """Reset transforms of the given bones, or all bones, with one foreach_set per property"""
+
+    pose_bones = rig.pose.bones
+    count = len(pose_bones)
+    indices = None if bone_names is None else [get_bone_indices(rig)[name] for name in bone_names]
+
+    for prop, rest in transform_rest.items():
+        rest = np.array(rest, dtype=np.float32)
+        if indices is None:
+            values = np.tile(rest, count)
+        else:
+            values = np.empty(count * len(rest), dtype=np.float32)
+            pose_bones.foreach_get(prop, values)
+            values.reshape(-1, len(rest))[indices] = rest
+        pose_bones.foreach_set(prop, values)
+
+    rig.update_tag(refresh={'DATA'})   # foreach_set() doesn't tag the pose for update
+
+
+def reset_rig_properties(rig:Object, owner_names:set[str]|None=None):
+    """Restore the schema's rig_properties to their defaults, optionally only properties of the given owners"""
+
+    for (owner_name, prop_name), value in get_property_defaults(rig).items():
+        if owner_names is not None and owner_name not in owner_names:
+            continue
+        owner = get_pose_bone(rig, owner_name)
+        if owner is not None and owner.get(prop_name) != value:
+            owner[prop_name] = value
+
+
+def get_rotation_prop(pose_bone:PoseBone) -> str:
+    """Rotation property which is used by pose bone's current rotation_mode"""
+
+    if pose_bone.rotation_mode in ['QUATERNION', 'AXIS_ANGLE']:
+        return f"rotation_{pose_bone.rotation_mode.lower()}"
+    return "rotation_euler"
+
+
+def resolve_keying_set(pose_bone:PoseBone, keying_set:list[str]) -> list[str]:
+    """Replace rotation property in keying_set with pose bone's current rotation_mode"""
+
+    return [get_rotation_prop(pose_bone) if prop.startswith("rotation") else prop for prop in keying_set]
+
+
+"""Keyframe interpolation as read by foreach_get(), the order of the interpolation enum"""
+INTERPOLATION_CONSTANT, INTERPOLATION_LINEAR, INTERPOLATION_BEZIER = 0, 1, 2
+
+"""Keyframe point attributes besides co and handles, as (property, foreach array type)"""
+keyframe_attributes = (
+    ("interpolation", np.int32),
+    ("easing", np.int32),
+    ("handle_left_type", np.int32),
+    ("handle_right_type", np.int32),
+    ("type", np.int32),
+    ("amplitude", np.float32),
+    ("back", np.float32),
+    ("period", np.float32),
+    ("select_control_point", bool),
+    ("select_left_handle", bool),
+    ("select_right_handle", bool),
+)
+
+
+def evaluate_fcurve_each(fcurve, frames:np.ndarray) -> np.ndarray:
+    return np.fromiter((fcurve.evaluate(frame) for frame in frames.tolist()), dtype=np.float64, count=len(frames))
+
+
+def evaluate_bezier_segments(start:np.ndarray, handle_right:np.ndarray, handle_left:np.ndarray, end:np.ndarray, frames:np.ndarray) -> np.ndarray:
+    """
+    Value of Bezier segments at frames, each argument holds one row per frame.
+    Handles are shortened like Blender does so the segment can't loop back in time, then x(t) = frame is bisected.
+    """
+    h1 = start - handle_right
+    h2 = end - handle_left
+    length = end[:, 0] - start[:, 0]
+    handle_length = np.abs(h1[:, 0]) + np.abs(h2[:, 0])
+    factor = np.where(handle_length > length, length / np.maximum(handle_length, 1e-12), 1.0)[:, None]
+    handle_right = start - h1 * factor
+    handle_left = end - h2 * factor
+
+    def bezier(t:np.ndarray, axis:int) -> np.ndarray:
+        u = 1.0 - t
+        return (u**3 * start[:, axis] + 3 * u**2 * t * handle_right[:, axis]
+                + 3 * u * t**2 * handle_left[:, axis] + t**3 * end[:, axis])
+
+    low = np.zeros(len(frames))
+    high = np.ones(len(frames))
+    for _ in range(32):
+        middle = (low + high) / 2
+        below = bezier(middle, 0) < frames
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+
+    return bezier((low + high) / 2, 1)
+
+
+def evaluate_fcurve(fcurve, frames:np.ndarray) -> np.ndarray:
+    """
+    Evaluate fcurve at frames from one foreach_get() per keyframe attribute, like fcurve.evaluate() does per frame.
+    Constant, linear and Bezier keys with constant extrapolation are evaluated in NumPy,
+    anything else (modifiers, easing interpolations, linear extrapolation) falls back to fcurve.evaluate().
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    points = fcurve.keyframe_points
+    count = len(points)
+    if count == 0 or len(fcurve.modifiers):
+        return evaluate_fcurve_each(fcurve, frames)
+
+    interpolation = np.empty(count, dtype=np.int32)
+    try:
+        points.foreach_get("interpolation", interpolation)
+    except (TypeError, RuntimeError):
+        return evaluate_fcurve_each(fcurve, frames)
+
+    co, handle_left, handle_right = (np.empty(count * 2, dtype=np.float32) for _ in range(3))
+    points.foreach_get("co", co)
+    points.foreach_get("handle_left", handle_left)
+    points.foreach_get("handle_right", handle_right)
+    co, handle_left, handle_right = (a.reshape(-1, 2).astype(np.float64) for a in (co, handle_left, handle_right))
+
+    values = np.empty(len(frames))
+    fallback = np.zeros(len(frames), dtype=bool)
+
+    before = frames <= co[0, 0]
+    after = frames >= co[-1, 0]
+    values[before] = co[0, 1]
+    values[after] = co[-1, 1]
+    if fcurve.extrapolation != 'CONSTANT':
+        fallback |= (frames < co[0, 0]) | (frames > co[-1, 0])
+
+    inside = np.flatnonzero(~(before | after))
+    segment = np.searchsorted(co[:, 0], frames[inside], side='right') - 1
+    kind = interpolation[segment]
+    start, end = co[segment], co[segment + 1]
+
+    constant = kind == INTERPOLATION_CONSTANT
+    values[inside[constant]] = start[constant, 1]
+
+    linear = kind == INTERPOLATION_LINEAR
+    factor = (frames[inside[linear]] - start[linear, 0]) / (end[linear, 0] - start[linear, 0])
+    values[inside[linear]] = start[linear, 1] + factor * (end[linear, 1] - start[linear, 1])
+
+    bezier = kind == INTERPOLATION_BEZIER
+    if bezier.any():
+        values[inside[bezier]] = evaluate_bezier_segments(
+            start[bezier], handle_right[segment[bezier]], handle_left[segment[bezier] + 1], end[bezier], frames[inside[bezier]]
+        )
+
+    fallback[inside[~(constant | linear | bezier)]] = True
+    if fallback.any():
+        values[fallback] = evaluate_fcurve_each(fcurve, frames[fallback])
+    return values
+
+
+def write_keyframes(fcurve, frames:np.ndarray, values:np.ndarray):
+    """
+    Write keyframes into fcurve with one foreach_set per attribute.
+    Keys on existing frames are replaced, like keyframe_insert() does.
+    """
+    points = fcurve.keyframe_points
+    count = len(points)
+
+    co = np.empty(count * 2, dtype=np.float32)
+    handle_left = np.empty(count * 2, dtype=np.float32)
+    handle_right = np.empty(count * 2, dtype=np.float32)
+    points.foreach_get("co", co)
+    points.foreach_get("handle_left", handle_left)
+    points.foreach_get("handle_right", handle_right)
+    co, handle_left, handle_right = (a.reshape(-1, 2) for a in (co, handle_left, handle_right))
+
+    """Replace values of existing keys, handles move along with the key"""
+    existing = dict(zip(co[:, 0].tolist(), range(count)))
+    indices = np.fromiter((existing.get(frame, -1) for frame in frames.tolist()), dtype=np.int64, count=len(frames))
+    replaced = indices >= 0
+    if replaced.any():
+        offset = values[replaced] - co[indices[replaced], 1]
+        co[indices[replaced], 1] = values[replaced]
+        handle_left[indices[replaced], 1] += offset
+        handle_right[indices[replaced], 1] += offset
+
+    """Append new keys, update() sorts them and calculates their auto handles"""
+    added = ~replaced
+    new_co = np.column_stack((frames[added], values[added])).astype(np.float32)
+    points.add(len(new_co))
+
+    points.foreach_set("co", np.concatenate((co, new_co)).ravel())
+    points.foreach_set("handle_left", np.concatenate((handle_left, new_co)).ravel())
+    points.foreach_set("handle_right", np.concatenate((handle_right, new_co)).ravel())
+
+    prefs = bpy.context.preferences.edit
+    if prefs.keyframe_new_interpolation_type != 'BEZIER' or prefs.keyframe_new_handle_type != 'AUTO_CLAMPED':
+        for point in points[count:]:
+            point.interpolation = prefs.keyframe_new_interpolation_type
+            point.handle_left_type = prefs.keyframe_new_handle_type
+            point.handle_right_type = prefs.keyframe_new_handle_type
+
+    fcurve.update()
+
+
+def get_simplified_keys(frames:np.ndarray, values:np.ndarray, tolerance:float) -> np.ndarray:
+    """
+    Mask of keys to keep so that linear interpolation between kept keys stays within tolerance of every removed key.
+    Ramer-Douglas-Peucker with the error of each segment computed as one NumPy operation.
+    """
+    keep = np.zeros(len(frames), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(frames) - 1)]
+
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        factor = (frames[first+1:last] - frames[first]) / (frames[last] - frames[first])
+        error = np.abs(values[first+1:last] - (values[first] + factor * (values[last] - values[first])))
+        worst = int(np.argmax(error))
+        if error[worst] > tolerance:
+            index = first + 1 + worst
+            keep[index] = True
+            segments.extend(((first, index), (index, last)))
+
+    return keep
+
+
+def get_channel_rest(data_path:str, index:int) -> float | None:
+    """Rest value of a pose bone transform channel, None for other channels"""
+
+    prop = data_path.rpartition(".")[2]
+    rest = transform_rest.get(prop)
+    return None if rest is None or index >= len(rest) else rest[index]
+
+
+def reduce_fcurve(fcurve, tolerance:float, frame_range:tuple[float, float]|None=None) -> tuple[int, bool]:
+    """
+    Remove keys which are within tolerance of the curve without them, optionally only inside frame_range.
+    Return the number of removed keys and whether the whole curve is constant at the channel's rest value.
+    """
+    points = fcurve.keyframe_points
+    count = len(points)
+    if count < 2:
+        rest = get_channel_rest(fcurve.data_path, fcurve.array_index)
+        is_static = count == 1 and rest is not None and abs(points[0].co[1] - rest) <= tolerance
+        return 0, is_static
+
+    co = np.empty(count * 2, dtype=np.float32)
+    handles = np.empty(count * 4, dtype=np.float32)
+    points.foreach_get("co", co)
+    points.foreach_get("handle_left", handles[:count*2])
+    points.foreach_get("handle_right", handles[count*2:])
+    frames, values = co[0::2], co[1::2]
+
+    if np.ptp(np.concatenate((values, handles[1::2]))) <= tolerance:
+        """Constant curve, one key holds the value"""
+        keep = np.zeros(count, dtype=bool)
+        keep[0] = True
+        rest = get_channel_rest(fcurve.data_path, fcurve.array_index)
+        is_static = rest is not None and abs(values[0] - rest) <= tolerance
+    else:
+        keep = np.ones(count, dtype=bool)
+        inside = np.arange(count)
+        if frame_range is not None:
+            inside = np.flatnonzero((frames >= frame_range[0]) & (frames <= frame_range[1]))
+        if len(inside) > 2:
+            keep[inside] = get_simplified_keys(frames[inside], values[inside], tolerance)
+        is_static = False
+
+    removed = count - int(np.count_nonzero(keep))
+    if removed:
+        rebuild_keyframes(fcurve, co.reshape(-1, 2), handles.reshape(2, -1, 2), keep)
+
+    return removed, is_static
+
+
+def rebuild_keyframes(fcurve, co:np.ndarray, handles:np.ndarray, keep:np.ndarray):
+    """
+    Replace the keys of fcurve by the kept ones with one foreach_get and foreach_set per key attribute.
+    Keys whose segment now spans removed keys are made linear, which is the curve get_simplified_keys() measured against.
+    """
+    points = fcurve.keyframe_points
+    count = len(points)
+    kept = np.flatnonzero(keep)
+
+    """Per key attributes carried over to the kept keys, enums are read as their integer value"""
+    attributes = {}
+    for prop, dtype in keyframe_attributes:
+        values = np.empty(count, dtype=dtype)
+        points.foreach_get(prop, values)
+        attributes[prop] = values[kept]
+    attributes["interpolation"][np.append(np.diff(kept) > 1, False)] = INTERPOLATION_LINEAR
+
+    points.clear()
+    points.add(len(kept))
+    for prop, values in attributes.items():
+        points.foreach_set(prop, values)
+    points.foreach_set("co", co[kept].ravel())
+    points.foreach_set("handle_left", handles[0][kept].ravel())
+    points.foreach_set("handle_right", handles[1][kept].ravel())
+
+    fcurve.update()
+
+
+def reduce_keyframes(obj:Object, tolerance:float, fcurves=None, frame_range:tuple[float, float]|None=None, remove_static=True) -> tuple[int, int]:
+    """
+    Reduce keys of the given F-curves, or every F-curve of obj's action.
+    Curves constant at the rest value are removed when remove_static is set. Return (removed keys, removed curves).
+    """
+    action = obj.animation_data.action if obj.animation_data else None
+    if action is None:
+        return 0, 0
+
+    removed_keys = removed_curves = 0
+    for fcurve in list(action.fcurves if fcurves is None else fcurves):
+        if fcurve.mute or fcurve.lock:
+            continue
+        removed, is_static = reduce_fcurve(fcurve, tolerance, frame_range)
+        removed_keys += removed
+        if remove_static and is_static:
+            action.fcurves.remove(fcurve)
+            removed_curves += 1
+
+    return removed_keys, removed_curves
+
+
+def get_rig_dependencies(rig:Object) -> set[Object]:
+    """Get the rig and objects it needs for evaluation: parents, constraint targets and driver targets"""
+
+    dependencies = set()
+    stack = [rig]
+
+    while stack:
+        obj = stack.pop()
+        if obj is None or obj in dependencies:
+            continue
+        dependencies.add(obj)
+        stack.append(obj.parent)
+
+        constraints = list(obj.constraints)
+        if obj.type == 'ARMATURE':
+            for pose_bone in obj.pose.bones:
+                constraints.extend(pose_bone.constraints)
+
+        for constraint in constraints:
+            for attr in ('target', 'pole_target'):
+                target = getattr(constraint, attr, None)
+                if isinstance(target, Object):
+                    stack.append(target)
+            for target in getattr(constraint, 'targets', ()):
+                """Armature constraint"""
+                stack.append(target.target)
+
+        for anim_data in (obj.animation_data, getattr(obj.data, 'animation_data', None)):
+            if anim_data is None:
+                continue
+            for fcurve in anim_data.drivers:
+                for variable in fcurve.driver.variables:
+                    for target in variable.targets:
+                        if isinstance(target.id, Object):
+                            stack.append(target.id)
+
+    return dependencies
+
+
+@contextmanager
+def isolate_evaluation(context:Context, objects:set[Object]):
+    """Temporarily disable all other objects of the view layer in viewports, so frame_set() only evaluates objects"""
+
+    disabled = []
+    try:
+        for obj in context.view_layer.objects:
+            if obj in objects or obj.hide_viewport:
+                continue
+            try:
+                obj.hide_viewport = True
+            except AttributeError:
+                """Linked object can't be edited"""
+                continue
+            disabled.append(obj)
+
+        yield
+    finally:
+        for obj in disabled:
+            obj.hide_viewport = False
+
+
+def sort_bones_by_hierarchy(rig:Object, bone_names) -> list[str]:
+    """Sort bone names so that parents come before their children"""
+
+    pose_bones = rig.pose.bones
+    return sorted(bone_names, key=lambda name: len(pose_bones[name].parent_recursive))
+
+
+def compute_basis_matrices(rig:Object, pose_matrices:dict[str, Matrix]) -> dict[str, Matrix]:
+    """
+    Compute the local (basis) matrix of each bone which puts it at the given pose space matrix.
+    Bones are solved parent to child from rest matrices and the new parent matrices,
+    so no depsgraph update is needed between bones of the same chain.
+    """
+    pose_bones = rig.pose.bones
+    solved = {}
+
+    def get_pose_matrix(pose_bone:PoseBone) -> Matrix:
+        if pose_bone.name in solved:
+            return solved[pose_bone.name]
+        if not any(parent.name in pose_matrices for parent in pose_bone.parent_recursive):
+            return pose_bone.matrix
+
+        """Bone between snapped bones follows its new parent"""
+        matrix = convert_local_to_pose(pose_bone, pose_bone.matrix_basis)
+        solved[pose_bone.name] = matrix
+        return matrix
+
+    def convert_local_to_pose(pose_bone:PoseBone, matrix:Matrix, invert=False) -> Matrix:
+        bone = pose_bone.bone
+        parent = pose_bone.parent
+        if parent is None:
+            return bone.convert_local_to_pose(matrix, bone.matrix_local, invert=invert)
+
+        return bone.convert_local_to_pose(
+            matrix, bone.matrix_local,
+            parent_matrix=get_pose_matrix(parent),
+            parent_matrix_local=parent.bone.matrix_local,
+            invert=invert
+        )
+
+    basis_matrices = {}
+    for bone_name in sort_bones_by_hierarchy(rig, pose_matrices):
+        pose_bone = pose_bones[bone_name]
+        basis_matrices[bone_name] = convert_local_to_pose(pose_bone, pose_matrices[bone_name], invert=True)
+        solved[bone_name] = pose_matrices[bone_name]
+
+    return basis_matrices
+
+
+def compute_fk_matrices(rig:Object, bone_names) -> dict[str, Matrix]:
+    """
+    Compute the pose space matrix of each bone from its local (basis) matrix, parent to child.
+    Constraints of the bones are ignored, so FK bones give their FK pose whatever the FK/IK switch is set to.
+    """
+    pose_bones = rig.pose.bones
+    bone_names = set(bone_names)
+    solved = {}
+
+    def get_pose_matrix(pose_bone:PoseBone) -> Matrix:
+        if pose_bone.name in solved:
+            return solved[pose_bone.name]
+        if pose_bone.name not in bone_names and not any(parent.name in bone_names for parent in pose_bone.parent_recursive):
+            return pose_bone.matrix
+
+        bone = pose_bone.bone
+        parent = pose_bone.parent
+        if parent is None:
+            matrix = bone.convert_local_to_pose(pose_bone.matrix_basis, bone.matrix_local)
+        else:
+            matrix = bone.convert_local_to_pose(
+                pose_bone.matrix_basis, bone.matrix_local,
+                parent_matrix=get_pose_matrix(parent),
+                parent_matrix_local=parent.bone.matrix_local,
+            )
+        solved[pose_bone.name] = matrix
+        return matrix
+
+    return {bone_name: get_pose_matrix(pose_bones[bone_name]) for bone_name in bone_names}
+
+
+def compute_pole_matrix(rig:Object, pole_name:str, upper_name:str, lower_name:str, fk_matrices:dict[str, Matrix]) -> Matrix:
+    """
+    Place the pole in the plane of the upper and lower bones, on the bent side of the joint,
+    as far from the joint as it is in rest pose. A straight chain keeps the rest direction of the pole.
+    """
+    bones = rig.data.bones
+    upper, lower, pole = bones[upper_name], bones[lower_name], bones[pole_name]
+
+    root = fk_matrices[upper_name].translation
+    joint = fk_matrices[lower_name].translation
+    tip = fk_matrices[lower_name] @ Vector((0.0, lower.length, 0.0))
+
+    rest_offset = pole.head_local - lower.head_local
+    direction = (joint - root) - (joint - root).project(tip - root)
+    if direction.length < 1e-6:
+        direction = (fk_matrices[upper_name] @ upper.matrix_local.inverted()).to_3x3() @ rest_offset
+
+    matrix = pole.matrix_local.copy()
+    matrix.translation = joint + direction.normalized() * rest_offset.length
+    return matrix
+
+
+def get_source_bones(rig:Object, bone_names) -> set[str]:
+    """Bones whose animation moves the given bones: the bones themselves, their parents and their constraint targets within rig"""
+
+    pose_bones = rig.pose.bones
+    sources = set()
+    stack = list(bone_names)
+
+    while stack:
+        pose_bone = pose_bones.get(stack.pop())
+        if pose_bone is None or pose_bone.name in sources:
+            continue
+        sources.add(pose_bone.name)
+        if pose_bone.parent:
+            stack.append(pose_bone.parent.name)
+
+        for constraint in pose_bone.constraints:
+            if getattr(constraint, 'target', None) == rig:
+                stack.append(constraint.subtarget)
+            if getattr(constraint, 'pole_target', None) == rig:
+                stack.append(constraint.pole_subtarget)
+            for target in getattr(constraint, 'targets', ()):
+                """Armature constraint"""
+                if target.target == rig:
+                    stack.append(target.subtarget)
+
+    return sources
+
+
+def get_keyed_frames(rig:Object, bone_names:set[str], data_paths:set[str], frame_start:int, frame_end:int) -> set[int]:
+    """Frames in range with a key on any channel of bone_names, or on any of data_paths"""
+
+    action = rig.animation_data.action if rig.animation_data else None
+    if action is None:
+        return set()
+
+    prefixes = {f'pose.bones["{bpy.utils.escape_identifier(bone_name)}"]' for bone_name in bone_names}
+    frames = set()
+    for fcurve in action.fcurves:
+        data_path = fcurve.data_path
+        if data_path not in data_paths and data_path.partition('"]')[0] + '"]' not in prefixes:
+            continue
+
+        points = fcurve.keyframe_points
+        co = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get("co", co)
+        keyed = np.rint(co[0::2]).astype(np.int64)
+        frames.update(keyed[(keyed >= frame_start) & (keyed <= frame_end)].tolist())
+
+    return frames
+
+
+def snap_bones_to_matrices(rig:Object, pose_matrices:dict[str, Matrix]):
+    """
+    Snap bones to pose space matrices without any view layer update.
+    Parents which aren't snapped are read as evaluated, so update the view layer first if they depend on a changed switch.
+    """
+    pose_bones = rig.pose.bones
+    for bone_name, basis in compute_basis_matrices(rig, pose_matrices).items():
+        pose_bones[bone_name].matrix_basis = basis
+
+
+class FCurveWriter:
+    """
+    Collect keyframes in memory and write each F-curve once.
+    Gives the same keys as calling keyframe_insert() for every value, without an RNA call per key.
+    """
+
+    def __init__(self, obj:Object, tolerance:float|None=None):
+        self.obj = obj
+        self.tolerance = tolerance                  # Skip keys which are this close to the existing F-curve
+        self.channels: dict[tuple[str, int], tuple[str, dict[float, float]]] = {}
+
+    def add(self, data_path:str, index:int, frame:float, value:float, group:str=""):
+        keys = self.channels.setdefault((data_path, index), (group, {}))[1]
+        keys[float(frame)] = float(value)
+
+    def add_bone(self, pose_bone:PoseBone, keying_set:list[str], frame:float):
+        """Store pose bone's current values of keying_set at frame"""
+
+        for prop in resolve_keying_set(pose_bone, keying_set):
+            data_path = pose_bone.path_from_id(prop)
+            for index, value in enumerate(getattr(pose_bone, prop)):
+                self.add(data_path, index, frame, value, group=pose_bone.name)
+
+    def add_bones(self, rig:Object, bone_map:list[str]|list[list], keying_set:list[str], frame:float):
+        for bone in bone_map:
+            bone_name = bone if type(bone) == str else bone[0]
+            self.add_bone(get_pose_bone(rig, bone_name), keying_set, frame)
+
+    def add_bone_property(self, pose_bone:PoseBone, prop_name:str, frame:float):
+        data_path = f'{pose_bone.path_from_id()}["{prop_name}"]'
+        self.add(data_path, 0, frame, pose_bone[prop_name], group=pose_bone.name)
+
+    def get_action(self):
+        anim_data = self.obj.animation_data or self.obj.animation_data_create()
+        if anim_data.action is None:
+            anim_data.action = bpy.data.actions.new(f"{self.obj.name}Action")
+        return anim_data.action
+
+    def get_changed(self, fcurve, frames:np.ndarray, values:np.ndarray) -> np.ndarray:
+        """Mask of values which differ from what fcurve already evaluates to"""
+
+        return np.abs(values - evaluate_fcurve(fcurve, frames)) > self.tolerance
+
+    def write(self) -> list:
+        """Write all collected keyframes, each F-curve is touched once. Return the written F-curves"""
+
+        written = []
+        if not self.channels:
+            return written
+        fcurves = self.get_action().fcurves
 
+        for (data_path, index), (group, keys) in self.channels.items():
+            frames = np.fromiter(keys.keys(), dtype=np.float32, count=len(keys))
+            values = np.fromiter(keys.values(), dtype=np.float32, count=len(keys))
+            fcurve = fcurves.find(data_path, index=index)
 
-def get_ponyrig(rig_id:str=RIG_ID) -> Object | None:
-    """Get ponyrig by searching object with property: rig_id"""
+            if fcurve is None:
+                fcurve = fcurves.new(data_path, index=index, action_group=group)
+            elif self.tolerance is not None:
+                changed = self.get_changed(fcurve, frames, values)
+                if not changed.any():
+                    continue
+                frames, values = frames[changed], values[changed]
 
-    for rig in bpy.data.objects:
-        if rig.get(rig_id) and rig.type == 'ARMATURE':
-            return rig
-        
-    return None
+            write_keyframes(fcurve, frames, values)
+            written.append(fcurve)
 
+        self.channels.clear()
+        return written
 
-def draw_bone_property(
-    layout: UILayout,
-    rig: Object,
-    prop_owner_name: str,
-    prop_name: str,
-    slider_name="",
-    texts=[],
-    icon_true="CHECKBOX_HLT",
-    icon_false='CHECKBOX_DEHLT',
-    translate=False
-):
-    prop_owner = rig.pose.bones.get(prop_owner_name)
-    if prop_owner is None:
-        layout.alert = True
-        layout.label(text=f'Missing property owner: "{prop_owner_name}"', icon="ERROR")
-        return
+
+def get_bone_channels(pose_bone:PoseBone, keying_set:list[str]) -> list[tuple[str, str, int]]:
+    """Keyed channels of a pose bone as (property, data path, array index)"""
+
+    channels = []
+    for prop in resolve_keying_set(pose_bone, keying_set):
+        data_path = pose_bone.path_from_id(prop)
+        channels.extend((prop, data_path, index) for index in range(len(getattr(pose_bone, prop))))
+    return channels
+
+
+class CtrlBoneKeyer:
+    """
+    Control bones of a rig with their keyed channels, resolved once per rig.
+    Values are read with one foreach_get per transform property and written through FCurveWriter.
+    """
+
+    keying_set = ["location", "rotation_quaternion", "scale"]
+
+    def __init__(self, rig:Object):
+        self.rig = rig
+        pose_bones = rig.pose.bones
+        bone_index = get_bone_indices(rig)
+        excluded_collections = get_rig_schema(rig).keyframe_excluded_collections
+
+        """Bones assigned to several collections are only keyed once"""
+        bone_names = {}
+        for collection in rig.data.collections:
+            if collection.name in excluded_collections:
+                continue
+            for bone in collection.bones_recursive:
+                bone_names.setdefault(bone.name)
+
+        """(bone index, bone name, property, data path, array index) of each keyed channel"""
+        self.channels = [
+            (bone_index[bone_name], bone_name, *channel)
+            for bone_name in bone_names
+            for channel in get_bone_channels(pose_bones[bone_name], self.keying_set)
+        ]
+        self.props = {channel[2] for channel in self.channels}
+
+    @classmethod
+    def get(cls, rig:Object) -> 'CtrlBoneKeyer':
+        return get_rig_cache(rig, cls.__name__, cls)
+
+    def read_values(self) -> dict[str, np.ndarray]:
+        """Current values of each keyed transform property of all pose bones"""
+
+        pose_bones = self.rig.pose.bones
+        values = {}
+        for prop in self.props:
+            size = transform_sizes[prop]
+            array = np.empty(len(pose_bones) * size, dtype=np.float32)
+            pose_bones.foreach_get(prop, array)
+            values[prop] = array.reshape(-1, size)
+        return values
+
+    def keyframe(self, writer:FCurveWriter, frame:float):
+        values = self.read_values()
+        for bone_index, bone_name, prop, data_path, index in self.channels:
+            writer.add(data_path, index, frame, values[prop][bone_index, index], group=bone_name)
+
+
+class PoseBuffer:
+    """
+    Snapshot of all bone local transforms and rig properties stored in NumPy arrays.
+    Captured and restored with one foreach_get/foreach_set per transform property.
+    """
+
+    transform_props = ("location", "rotation_quaternion", "rotation_euler", "rotation_axis_angle", "scale")
+
+    def __init__(self, bone_names:tuple[str], transforms:dict[str, np.ndarray], properties:dict, matrices:np.ndarray|None=None):
+        self.bone_names = bone_names
+        self.transforms = transforms        # transform property -> (bones, array size)
+        self.properties = properties        # (prop owner, prop name) -> value
+        self.matrices = matrices            # (bones, 4, 4) pose space matrices, if captured
+        self.bone_indices = {bone_name: i for i, bone_name in enumerate(bone_names)}
+
+    @classmethod
+    def capture(cls, rig:Object, matrices=False) -> 'PoseBuffer':
+        pose_bones = rig.pose.bones
+        count = len(pose_bones)
+
+        transforms = {}
+        for prop in cls.transform_props:
+            size = transform_sizes[prop]
+            values = np.empty(count * size, dtype=np.float32)
+            pose_bones.foreach_get(prop, values)
+            transforms[prop] = values.reshape(-1, size)
+
+        properties = {}
+        for owner_name, prop_name in get_rig_schema(rig).rig_properties:
+            owner = pose_bones.get(owner_name)
+            if owner is not None and owner.get(prop_name) is not None:
+                properties[(owner_name, prop_name)] = owner[prop_name]
+
+        pose_matrices = None
+        if matrices:
+            pose_matrices = np.empty(count * 16, dtype=np.float32)
+            pose_bones.foreach_get("matrix", pose_matrices)
+            pose_matrices = pose_matrices.reshape(-1, 4, 4).transpose(0, 2, 1)     # foreach_get() gives column major matrices
+
+        return cls(tuple(get_bone_indices(rig)), transforms, properties, pose_matrices)
+
+    def get_matrices(self, bone_names:list[str]) -> dict[str, Matrix]:
+        """Captured pose space matrices of the given bones"""
+        return {bone_name: Matrix(self.matrices[self.bone_indices[bone_name]].tolist()) for bone_name in bone_names}
+
+    def restore(self, rig:Object, bone_names:list[str]|None=None, properties=True):
+        """Write the captured pose back onto rig, optionally only onto the given bones"""
+
+        pose_bones = rig.pose.bones
+        rig_indices = get_bone_indices(rig)
+
+        if bone_names is None and tuple(rig_indices) == self.bone_names:
+            for prop, values in self.transforms.items():
+                pose_bones.foreach_set(prop, values.ravel())
+        else:
+            names = [name for name in (bone_names or self.bone_names) if name in rig_indices and name in self.bone_indices]
+            source = [self.bone_indices[name] for name in names]
+            target = [rig_indices[name] for name in names]
+            for prop, values in self.transforms.items():
+                current = np.empty(len(pose_bones) * values.shape[1], dtype=np.float32)
+                pose_bones.foreach_get(prop, current)
+                current.reshape(-1, values.shape[1])[target] = values[source]
+                pose_bones.foreach_set(prop, current)
+
+        rig.update_tag(refresh={'DATA'})   # foreach_set() doesn't tag the pose for update
+
+        if properties:
+            for (owner_name, prop_name), value in self.properties.items():
+                if bone_names is not None and owner_name not in bone_names:
+                    continue
+                owner = pose_bones.get(owner_name)
+                if owner is not None and owner.get(prop_name) != value:
+                    owner[prop_name] = value
+
+    def blend(self, other:'PoseBuffer', factor:float) -> 'PoseBuffer':
+        """Interpolate from this pose towards other pose"""
+
+        if self.bone_names != other.bone_names:
+            raise ValueError("Can't blend poses of different bones")
+
+        transforms = {}
+        for prop, values in self.transforms.items():
+            other_values = other.transforms[prop]
+            if prop == "rotation_quaternion":
+                """Blend along the shortest path and keep quaternions normalized"""
+                sign = np.where(np.sum(values * other_values, axis=1, keepdims=True) < 0, -1.0, 1.0)
+                blended = values + (other_values * sign - values) * factor
+                length = np.linalg.norm(blended, axis=1, keepdims=True)
+                blended = np.divide(blended, length, out=values.copy(), where=length > 0)
+            else:
+                blended = values + (other_values - values) * factor
+            transforms[prop] = blended.astype(np.float32)
+
+        properties = dict(self.properties)
+        for key, other_value in other.properties.items():
+            value = properties.get(key, other_value)
+            if isinstance(value, float) and isinstance(other_value, float):
+                properties[key] = value + (other_value - value) * factor
+            elif factor >= 0.5:
+                properties[key] = other_value
+
+        return PoseBuffer(self.bone_names, transforms, properties)
+
+
+"""Stored poses of the pose buffer operator: (rig session_uid, slot) -> PoseBuffer"""
+_pose_buffers: dict[tuple[int, str], PoseBuffer] = {}
+
+
+class TransformCache:
+    """
+    Local transforms of bones over a frame range, stored in a binary file which is read through np.memmap.
+    Layout: magic, header size (uint32), JSON header padded to 64 bytes, float32 array of (frames, bones, channels).
+    """
+
+    magic = b"PONYRIGCACHE"
+    version = 1
+    channels = (("location", 3), ("rotation_quaternion", 4), ("scale", 3))
+    channel_size = sum(size for _, size in channels)
+    alignment = 64
+
+    def __init__(self, filepath:str, header:dict, data:np.memmap):
+        self.filepath = filepath
+        self.header = header
+        self.data = data                                    # (frames, bones, channel_size)
+        self.bone_indices = {bone_name: i for i, bone_name in enumerate(header["bones"])}
+
+    @property
+    def frames(self) -> np.ndarray:
+        return np.arange(len(self.data), dtype=np.float32) + self.header["frame_start"]
+
+    @classmethod
+    def encode_header(cls, header:dict) -> bytes:
+        text = json.dumps(header).encode()
+        prefix = cls.magic + len(text).to_bytes(4, 'little')
+        padding = -(len(prefix) + len(text)) % cls.alignment
+        return prefix + text + b" " * padding
+
+    @classmethod
+    def create(cls, filepath:str, bone_names:list[str], frame_start:int, frame_count:int, **info) -> 'TransformCache':
+        header = {
+            "version": cls.version,
+            "bones": list(bone_names),
+            "frame_start": frame_start,
+            "channels": [name for name, _ in cls.channels],
+            **info,
+        }
+        header_bytes = cls.encode_header(header)
+        shape = (frame_count, len(bone_names), cls.channel_size)
+        data = np.memmap(filepath, dtype=np.float32, mode='w+', offset=len(header_bytes), shape=shape)
+        with open(filepath, 'r+b') as file:
+            file.write(header_bytes)
+        return cls(filepath, header, data)
+
+    @classmethod
+    def open(cls, filepath:str) -> 'TransformCache':
+        with open(filepath, 'rb') as file:
+            if file.read(len(cls.magic)) != cls.magic:
+                raise ValueError(f"'{filepath}' isn't a PonyRig transform cache")
+            size = int.from_bytes(file.read(4), 'little')
+            header = json.loads(file.read(size))
+        if header.get("version") != cls.version:
+            raise ValueError(f"Unsupported cache version: {header.get('version')}")
+
+        offset = len(cls.magic) + 4 + size
+        offset += -offset % cls.alignment
+        data = np.memmap(filepath, dtype=np.float32, mode='r', offset=offset)
+        return cls(filepath, header, data.reshape(-1, len(header["bones"]), cls.channel_size))
+
+    def make_quaternions_continuous(self):
+        """Flip quaternions which point away from the previous frame's, so keys interpolate the short way"""
+
+        quaternions = self.data[:, :, 3:7]
+        flips = np.sum(quaternions[1:] * quaternions[:-1], axis=2, keepdims=True) < 0
+        quaternions[1:] *= np.where(np.cumsum(flips, axis=0) % 2, -1.0, 1.0)
+
+    def flush(self):
+        self.data.flush()
+
+
+def export_transform_cache(context:Context, rig:Object, bone_names:list[str], frame_start:int, frame_end:int,
+                           filepath:str, rig_only=False) -> TransformCache:
+    """
+    Evaluate the rig once per frame and store the local transforms which reproduce each bone's evaluated pose.
+    Frames are written straight into the memory mapped file.
+    """
+    scene = context.scene
+    active_frame = scene.frame_current
+    pose_bones = rig.pose.bones
+    bone_indices = get_bone_indices(rig)
+    indices = [bone_indices[bone_name] for bone_name in bone_names]
+
+    cache = TransformCache.create(filepath, bone_names, frame_start, frame_end - frame_start + 1, rig=rig.name, fps=scene.render.fps)
+    matrices = np.empty(len(pose_bones) * 16, dtype=np.float32)
+    isolation = isolate_evaluation(context, get_rig_dependencies(rig)) if rig_only else nullcontext()
+
+    finished = False
     try:
-        prop_value = prop_owner.path_resolve(f'["{prop_name}"]') # Property existence check.
-    except ValueError:
-        layout.alert = True
-        layout.label(text=f'Missing property: "{prop_name}", owner: "{prop_owner_name}"', icon="ERROR")
-        return
+        with isolation:
+            for row, frame in enumerate(range(frame_start, frame_end+1)):
+                scene.frame_set(frame)
+                pose_bones.foreach_get("matrix", matrices)
+                selected = matrices.reshape(-1, 4, 4).transpose(0, 2, 1)[indices]     # foreach_get() gives column major matrices
+
+                basis = compute_basis_matrices(rig, {bone_name: Matrix(matrix.tolist()) for bone_name, matrix in zip(bone_names, selected)})
+                for column, bone_name in enumerate(bone_names):
+                    location, rotation, scale = basis[bone_name].decompose()
+                    cache.data[row, column] = (*location, *rotation, *scale)
+
+        cache.make_quaternions_continuous()
+        cache.flush()
+        finished = True
+    finally:
+        scene.frame_set(active_frame)
+        if not finished:
+            """Don't leave a partially written cache behind, the memory map has to be released before removing it"""
+            del cache
+            os.remove(filepath)
+    return cache
+
+
+def get_cached_rotation(pose_bone:PoseBone, quaternions:np.ndarray) -> tuple[str, np.ndarray]:
+    """Cached quaternions converted to the bone's rotation mode, as (property, values per frame)"""
+
+    mode = pose_bone.rotation_mode
+    if mode == 'QUATERNION':
+        return "rotation_quaternion", quaternions
+    if mode == 'AXIS_ANGLE':
+        values = [(angle, *axis) for axis, angle in (Quaternion(q).to_axis_angle() for q in quaternions.tolist())]
+        return "rotation_axis_angle", np.array(values, dtype=np.float32)
+
+    values = []
+    euler = None
+    for q in quaternions.tolist():
+        euler = Quaternion(q).to_euler(mode, euler) if euler else Quaternion(q).to_euler(mode)
+        values.append(tuple(euler))
+    return "rotation_euler", np.array(values, dtype=np.float32)
+
+
+def import_transform_cache(rig:Object, cache:TransformCache, frame_offset:int=0) -> int:
+    """Key the cached transforms onto rig with one bulk write per F-curve, return the number of keyed bones"""
+
+    fcurves = FCurveWriter(rig).get_action().fcurves
+    frames = cache.frames + frame_offset
+    keyed = 0
+
+    for bone_name, column in cache.bone_indices.items():
+        pose_bone = rig.pose.bones.get(bone_name)
+        if pose_bone is None:
+            continue
+        values = np.asarray(cache.data[:, column])
+        rotation_prop, rotation = get_cached_rotation(pose_bone, values[:, 3:7])
+        channels = {"location": values[:, 0:3], rotation_prop: rotation, "scale": values[:, 7:10]}
+
+        for prop, prop_values in channels.items():
+            data_path = pose_bone.path_from_id(prop)
+            for index in range(prop_values.shape[1]):
+                fcurve = fcurves.find(data_path, index=index) or fcurves.new(data_path, index=index, action_group=bone_name)
+                write_keyframes(fcurve, frames, np.ascontiguousarray(prop_values[:, index]))
+        keyed += 1
+
+    return keyed
+
+
+def split_bone_data_path(data_path:str) -> tuple[str, str] | None:
+    """Split 'pose.bones["name"].location' into ('name', '.location'), None for paths of other data"""
+
+    prefix = 'pose.bones["'
+    if not data_path.startswith(prefix):
+        return None
+    end = data_path.find('"]', len(prefix))
+    while end != -1 and data_path[end-1] == '\\':
+        """Escaped quote inside the bone name"""
+        end = data_path.find('"]', end+1)
+    if end == -1:
+        return None
+    return bpy.utils.unescape_identifier(data_path[len(prefix):end]), data_path[end+2:]
+
+
+def offset_fcurve(fcurve, frame_offset:float):
+    """Shift all keys and their handles in time with one foreach_get and foreach_set per attribute"""
+
+    points = fcurve.keyframe_points
+    values = np.empty(len(points) * 2, dtype=np.float32)
+    for prop in ("co", "handle_left", "handle_right"):
+        points.foreach_get(prop, values)
+        values[0::2] += frame_offset
+        points.foreach_set(prop, values)
+
+
+def copy_fcurve(fcurve, fcurves):
+    """Copy fcurve and its keys into fcurves with one foreach_get and foreach_set per key attribute"""
+
+    copy = fcurves.new(fcurve.data_path, index=fcurve.array_index, action_group=fcurve.group.name if fcurve.group else "")
+    copy.extrapolation = fcurve.extrapolation
+    copy.mute = fcurve.mute
+
+    points = fcurve.keyframe_points
+    count = len(points)
+    copy.keyframe_points.add(count)
+    for prop, dtype, size in (
+        ("co", np.float32, 2), ("handle_left", np.float32, 2), ("handle_right", np.float32, 2),
+        *((prop, dtype, 1) for prop, dtype in keyframe_attributes),
+    ):
+        values = np.empty(count * size, dtype=dtype)
+        points.foreach_get(prop, values)
+        copy.keyframe_points.foreach_set(prop, values)
+
+    copy.update()
+    return copy
+
+
+def transfer_action(source:Object, target:Object, bone_map:dict[str, str], frame_offset:float=0.0) -> tuple[int, int]:
+    """
+    Give target a copy of source's action retargeted to its bones. Bone channels are renamed through bone_map,
+    channels of bones and properties target doesn't have are dropped, and keys are shifted by frame_offset.
+    Object level channels stay with the source, the target's own object level channels are copied into the new action.
+    Return the number of kept and dropped F-curves.
+    """
+    source_action = source.animation_data.action if source.animation_data else None
+    if source_action is None:
+        return 0, 0
+
+    """Copying the action duplicates every F-curve in one call, with its keys, handles and modifiers"""
+    action = source_action.copy()
+    action.name = f"{target.name}Action"
+    pose_bones = target.pose.bones
+
+    """Remapped channels come first, so they win over a channel the target bone already had in the source"""
+    channels = [(fcurve, split_bone_data_path(fcurve.data_path)) for fcurve in action.fcurves]
+    channels.sort(key=lambda channel: channel[1] is None or channel[1][0] not in bone_map)
+
+    kept = set()
+    dropped = []
+    for fcurve, split in channels:
+        if split is None:
+            dropped.append(fcurve)
+            continue
+
+        bone_name, prop_path = split
+        target_name = bone_map.get(bone_name, bone_name)
+        pose_bone = pose_bones.get(target_name)
+        if pose_bone is None or (prop_path.startswith('["') and pose_bone.get(prop_path[2:-2]) is None):
+            dropped.append(fcurve)
+            continue
+
+        data_path = f'pose.bones["{bpy.utils.escape_identifier(target_name)}"]{prop_path}'
+        if (data_path, fcurve.array_index) in kept:
+            dropped.append(fcurve)
+            continue
+        kept.add((data_path, fcurve.array_index))
+
+        if data_path != fcurve.data_path:
+            fcurve.data_path = data_path
+            fcurve.group = action.groups.get(target_name) or action.groups.new(target_name)
+        if frame_offset:
+            offset_fcurve(fcurve, frame_offset)
+
+    for fcurve in dropped:
+        action.fcurves.remove(fcurve)
+    for group in [group for group in action.groups if not group.channels]:
+        action.groups.remove(group)
+
+    anim_data = target.animation_data or target.animation_data_create()
+    if anim_data.action is not None:
+        """Target keeps its own placement and other non-bone animation"""
+        for fcurve in anim_data.action.fcurves:
+            if split_bone_data_path(fcurve.data_path) is None:
+                copy_fcurve(fcurve, action.fcurves)
+    anim_data.action = action
+    if getattr(anim_data, "action_slot", True) is None and action.slots:
+        """Slot of the copy was made for the source object"""
+        anim_data.action_slot = action.slots[0]
+
+    return len(kept), len(dropped)
+
+
+"""Values of the rig's viewport 'Quality' property"""
+QUALITY_PERFORMANCE, QUALITY_HIGH, QUALITY_RENDER = 0, 1, 2
+
+
+def get_rig_quality(rig:Object) -> int | None:
+    owner_name, prop_name = get_rig_schema(rig).quality
+    owner = rig.pose.bones.get(owner_name)
+    return None if owner is None else owner.get(prop_name)
+
+
+def set_rig_quality(rig:Object, level:int) -> bool:
+    """Set the rig's viewport quality, return False if it didn't change"""
+
+    owner_name, prop_name = get_rig_schema(rig).quality
+    owner = rig.pose.bones.get(owner_name)
+    if owner is None or owner.get(prop_name) is None or owner[prop_name] == level:
+        return False
+    try:
+        owner[prop_name] = level
+    except (TypeError, AttributeError):
+        """Linked rig without override"""
+        return False
+    """Writing an ID property doesn't tag the depsgraph, drivers reading Quality wouldn't re-evaluate"""
+    rig.update_tag()
+    return True
+
 
-    if len(texts) > 0 and type(prop_value) == int:
-        text = slider_name + ": " + texts[prop_value]
-        layout.prop(prop_owner, f'["{prop_name}"]', text=text, slider=True, translate=translate)
-    elif type(prop_value) == float:
-        layout.prop(prop_owner, f'["{prop_name}"]', text=slider_name, slider=True, translate=translate)
-    elif type(prop_value) == bool:
-        icon = icon_true if prop_value else icon_false
-        layout.prop(prop_owner, f'["{prop_name}"]', text=slider_name, toggle=True, icon=icon, translate=translate)
+def get_rig_bounds(rig:Object) -> tuple[Vector, float]:
+    """World space center and radius of the rig's bounding box"""
+
+    center = rig.matrix_world @ (sum((Vector(corner) for corner in rig.bound_box), Vector()) / 8)
+    return center, max(rig.dimensions) / 2
+
+
+def get_lod_level(scene, camera:Object, rig:Object, settings, current:int) -> int:
+    """Viewport quality of rig as seen by camera. Thresholds are widened by the hysteresis towards the current level"""
+
+    center, radius = get_rig_bounds(rig)
+
+    if settings.use_frustum:
+        margin = radius / max((center - camera.matrix_world.translation).length, 1e-6)
+        x, y, z = world_to_camera_view(scene, camera, center)
+        if z < -radius or not (-margin <= x <= 1 + margin and -margin <= y <= 1 + margin):
+            return QUALITY_PERFORMANCE
+
+    is_high = current != QUALITY_PERFORMANCE
+    hysteresis = settings.hysteresis if is_high else -settings.hysteresis
+    distance = (center - camera.matrix_world.translation).length
+
+    if settings.metric == 'DISTANCE':
+        is_high = distance <= settings.distance * (1 + hysteresis)
     else:
-        layout.prop(prop_owner, f'["{prop_name}"]', text=slider_name, translate=translate)
+        if camera.data.type == 'ORTHO':
+            screen_size = radius / (camera.data.ortho_scale / 2)
+        else:
+            screen_size = radius / max(distance * math.tan(camera.data.angle / 2), 1e-6)
+        is_high = screen_size >= settings.screen_size * (1 - hysteresis)
+
+    return QUALITY_HIGH if is_high else QUALITY_PERFORMANCE
+
+
+"""Quality of each rig before a final render forced it to Render: rig name -> level"""
+_render_quality: dict[str, int] = {}
+
+
+def update_crowd_lod(scene):
+    """Set viewport quality of every rig from the scene's LOD settings"""
+
+    settings = scene.ponyrig_lod
+    if not settings.use_lod or _render_quality or _playback_state is not None:
+        """Final renders and playback performance mode own the quality meanwhile"""
+        return
+    camera = scene.camera
+
+    for rig in get_ponyrigs():
+        current = get_rig_quality(rig)
+        if current is None:
+            continue
+        if settings.force_render:
+            set_rig_quality(rig, QUALITY_RENDER)
+        elif camera is not None:
+            set_rig_quality(rig, get_lod_level(scene, camera, rig, settings, current))
+
+
+"""Modifier types disabled in viewports by playback performance mode"""
+expensive_modifiers = {
+    'SUBSURF', 'MULTIRES', 'SOLIDIFY', 'CORRECTIVE_SMOOTH', 'SMOOTH', 'LAPLACIANSMOOTH',
+    'SURFACE_DEFORM', 'MESH_DEFORM', 'SHRINKWRAP', 'DATA_TRANSFER',
+}
+
+
+class PlaybackState:
+    """Viewport state changed by playback performance mode, so it can be restored exactly"""
+
+    def __init__(self):
+        self.quality: dict[str, int] = {}                       # rig name -> quality level
+        self.collections: list[str] = []                        # names of collections hidden
+        self.modifiers: list[tuple[str, str]] = []              # (object name, modifier name) disabled
+        self.reasons: set[str] = set()                          # 'PLAYBACK' and/or 'SCRUB'
+
+    def apply(self, rigs:list[Object]):
+        for rig in rigs:
+            quality = get_rig_quality(rig)
+            if quality is not None and set_rig_quality(rig, QUALITY_PERFORMANCE):
+                self.quality[rig.name] = quality
+
+            schema = get_rig_schema(rig)
+            for tag in (schema.magic_collection, schema.outline_collection):
+                collection = get_tagged_collection(tag)
+                if collection is None or collection.hide_viewport or collection.name in self.collections:
+                    continue
+                try:
+                    collection.hide_viewport = True
+                except AttributeError:
+                    """Linked collection can't be edited"""
+                    continue
+                self.collections.append(collection.name)
+
+            for obj in rig.children_recursive:
+                for modifier in obj.modifiers:
+                    if modifier.type not in expensive_modifiers or not modifier.show_viewport:
+                        continue
+                    try:
+                        modifier.show_viewport = False
+                    except AttributeError:
+                        continue
+                    self.modifiers.append((obj.name, modifier.name))
+
+    def restore(self):
+        for rig_name, quality in self.quality.items():
+            rig = bpy.data.objects.get(rig_name)
+            if rig is not None:
+                set_rig_quality(rig, quality)
+
+        for collection_name in self.collections:
+            collection = bpy.data.collections.get(collection_name)
+            if collection is not None:
+                collection.hide_viewport = False
+
+        for obj_name, modifier_name in self.modifiers:
+            obj = bpy.data.objects.get(obj_name)
+            modifier = obj and obj.modifiers.get(modifier_name)
+            if modifier is not None:
+                modifier.show_viewport = True
+
+
+_playback_state: PlaybackState | None = None
+
+
+def begin_playback_performance(scene, reason:str):
+    global _playback_state
+
+    if not scene.ponyrig_playback_performance:
+        return
+    if _playback_state is None:
+        _playback_state = PlaybackState()
+        _playback_state.apply(get_ponyrigs())
+    _playback_state.reasons.add(reason)
+
+
+def end_playback_performance(scene, reason:str):
+    global _playback_state
+
+    if _playback_state is None:
+        return
+    _playback_state.reasons.discard(reason)
+    if not _playback_state.reasons:
+        state, _playback_state = _playback_state, None
+        state.restore()
+        update_crowd_lod(scene)
+
+
+def poll_scrubbing() -> float:
+    """Timer catching timeline scrubbing, which has no handler of its own"""
+
+    context = bpy.context
+    scene = context.scene
+    if scene is None:
+        return 0.25
+
+    is_scrubbing = any(window.screen.is_scrubbing for window in context.window_manager.windows)
+    if is_scrubbing:
+        begin_playback_performance(scene, 'SCRUB')
+        return 0.1
+    end_playback_performance(scene, 'SCRUB')
+    return 0.25
+
+
+def update_playback_performance(self, context):
+    if not self.ponyrig_playback_performance and _playback_state is not None:
+        _playback_state.reasons.clear()
+        end_playback_performance(context.scene, 'PLAYBACK')
 
 
 class PonyRig_OutlineItem(PropertyGroup):
@@ -132,6 +1894,48 @@ class PonyRig_RigPreferences(PropertyGroup):
     outline_items: CollectionProperty(type=PonyRig_OutlineItem, options={'LIBRARY_EDITABLE'}, override={'LIBRARY_OVERRIDABLE'})    # type: ignore
 
 
+def update_lod_settings(self, context):
+    update_crowd_lod(context.scene)
+
+
+class PonyRig_LODSettings(PropertyGroup):
+    """Store automatic viewport quality settings into scene.ponyrig_lod"""
+
+    use_lod: BoolProperty(
+        name="Automatic Quality", default=False, update=update_lod_settings,
+        description="Set each rig's viewport quality from its distance or size as seen by the scene camera",
+    )                                                                                                   # type: ignore
+    metric: EnumProperty(
+        name="Metric",
+        items=[
+            ('DISTANCE', "Distance", "Use High quality for rigs closer to the camera than the distance"),
+            ('SCREEN', "Screen Size", "Use High quality for rigs taking more of the frame than the screen size"),
+        ],
+        default='DISTANCE', update=update_lod_settings,
+    )                                                                                                   # type: ignore
+    distance: FloatProperty(name="Distance", default=15.0, min=0.0, subtype='DISTANCE', update=update_lod_settings)     # type: ignore
+    screen_size: FloatProperty(
+        name="Screen Size", default=0.1, min=0.0, max=1.0, subtype='FACTOR', update=update_lod_settings,
+        description="Rig radius relative to half of the camera frame",
+    )                                                                                                   # type: ignore
+    hysteresis: FloatProperty(
+        name="Hysteresis", default=0.1, min=0.0, max=0.9, subtype='FACTOR', update=update_lod_settings,
+        description="Relative margin around the threshold, avoids rigs flipping quality back and forth",
+    )                                                                                                   # type: ignore
+    use_frustum: BoolProperty(
+        name="Off Screen Performance", default=True, update=update_lod_settings,
+        description="Use Performance quality for rigs outside of the camera frame",
+    )                                                                                                   # type: ignore
+    force_render: BoolProperty(
+        name="Force Render Quality", default=False, update=update_lod_settings,
+        description="Set every rig to Render quality",
+    )                                                                                                   # type: ignore
+    render_quality: BoolProperty(
+        name="Render Quality for Final Renders", default=True,
+        description="Temporarily set every rig to Render quality while rendering, only when Crowd LOD is enabled",
+    )                                                                                                   # type: ignore
+
+
 class PonyRigPanel:
     bl_space_type = 'VIEW_3D'
     bl_category = 'PonyRig'
@@ -145,17 +1949,17 @@ class PONY_PT_MAIN(PonyRigPanel, Panel):
         """Draw viewport quality controller"""
 
         if rig != None:
-            prop_owner = rig.pose.bones.get(prop_owner_name)
+            descriptor = get_property_descriptor(rig, prop_owner_name, prop_name)
         else:
             return
 
-        try:
-            prop_val = prop_owner.path_resolve(f'["{prop_name}"]')
-            text = ['Performance', 'High', 'Render']
-            layout.prop(prop_owner, f'["{prop_name}"]', text=f"Viewport Quality: {text[prop_val]}", slider=True)
-        except ValueError:
+        if descriptor.error:
             layout.alert = True
             layout.label(text=f"Missing property in '{prop_owner_name}': '{prop_name}'  ")
+        else:
+            text = ['Performance', 'High', 'Render']
+            prop_val = descriptor.owner[prop_name]
+            layout.prop(descriptor.owner, descriptor.data_path, text=f"Viewport Quality: {text[prop_val]}", slider=True)
 
     def draw_config_solid_shading(self,context:Context, layout:UILayout):
         if hasattr(context.space_data, "shading"):
@@ -193,32 +1997,85 @@ class PONY_PT_MAIN(PonyRigPanel, Panel):
             layout.prop(shading, "show_backface_culling", icon=icon)
 
     def draw_keyframe_all_ctrl_bones(self, context:Context, layout:UILayout):
-        pass
+        layout.operator('pose.ponyrig_keyframe_all_ctrl_bones', text="Keyframe All", icon='KEYINGSET')
+
+    def draw_profiler(self, context:Context, layout:UILayout):
+        """Draw profiling toggle and a rolling summary of recorded times"""
+
+        row = layout.row(align=True)
+        row.prop(context.window_manager, "ponyrig_profile", toggle=True, icon='TIME')
+        if not profiler.enabled:
+            return
+        row.operator('wm.ponyrig_profile_reset', text="", icon='X')
+        row.operator('wm.ponyrig_profile_dump', text="", icon='EXPORT')
+
+        column = layout.box().column(align=True)
+        for name, samples, mean, peak in profiler.summary():
+            column.label(text=f"{name}: {mean*1000:.2f} ms, max {peak*1000:.2f} ms ({samples})", translate=False)
+        for name, count in profiler.counts.items():
+            column.label(text=f"{name}: {count} calls", translate=False)
 
     def draw_reset_bones(self, context:Context, layout:UILayout):
         layout.operator('pose.ponyrig_rest', text="Reset Rig", icon='LOOP_BACK')
 
+    def draw_reduce_keys(self, context:Context, layout:UILayout):
+        layout.operator('pose.ponyrig_reduce_keys', text="Reduce Keys", icon='IPO_BEZIER')
+
+    def draw_pose_buffers(self, rig:Object, layout:UILayout):
+        """Draw capture and swap buttons of each pose buffer slot"""
+
+        row = layout.row(align=True)
+        for slot in ('A', 'B'):
+            sub = row.row(align=True)
+            op = sub.operator('pose.ponyrig_pose_buffer', text=f"Pose {slot}", icon='COPYDOWN')
+            op.action, op.slot = 'CAPTURE', slot
+
+            sub = sub.row(align=True)
+            sub.enabled = (rig.session_uid, slot) in _pose_buffers
+            op = sub.operator('pose.ponyrig_pose_buffer', text="", icon='UV_SYNC_SELECT')
+            op.action, op.slot = 'SWAP', slot
+
+        sub = row.row(align=True)
+        sub.operator('pose.ponyrig_cache_export', text="", icon='EXPORT')
+        sub.operator('pose.ponyrig_cache_import', text="", icon='IMPORT')
+        sub.operator('pose.ponyrig_transfer_animation', text="", icon='ACTION')
+
+    @profiled
     def draw(self, context):
         layout = self.layout
-        rig = get_ponyrig()
+        rig = get_active_ponyrig(context)
 
         if rig:
+            schema = get_rig_schema(rig)
+            if schema.error:
+                row = layout.row()
+                row.alert = True
+                row.label(text=schema.error, icon='ERROR')
+
             row = layout.row()
-            self.draw_viewport_prop(rig, "properties", "Quality", layout=row)
+            self.draw_viewport_prop(rig, *schema.quality, layout=row)
             self.draw_config_solid_shading(context, row)
 
+            layout.prop(context.scene, "ponyrig_playback_performance", icon='PLAY')
+
             row = layout.row()
             self.draw_show_in_front_option(rig, row)
             self.draw_backface_culling_option(context, row)
 
             row = layout.row()
+            self.draw_keyframe_all_ctrl_bones(context, row)
             self.draw_reset_bones(context, row)
+            self.draw_reduce_keys(context, row)
+
+            self.draw_pose_buffers(rig, layout)
         else:
             self.draw_backface_culling_option(context, layout.row())
             row = layout.row()
             row.alert = True
             row.label(text=f"Can't find rig with property: '{RIG_ID}', check if it exist or is set to false.", icon='ERROR')
 
+        self.draw_profiler(context, layout)
+
     @classmethod
     def poll(cls, context):
         return True
@@ -227,7 +2084,6 @@ class PONY_PT_MAIN(PonyRigPanel, Panel):
 class PONY_PT_bone_collections(PonyRigPanel, Panel):
     bl_parent_id = 'PONY_PT_MAIN'
     bl_label = 'Bone Collections'
-    rig = get_ponyrig()
 
     def draw_ponyrig_collections(self, armature:Object, coll_name:str, layout:UILayout):
         """Match and draw collections from given collection name. """
@@ -270,26 +2126,304 @@ class PONY_PT_bone_collections(PonyRigPanel, Panel):
             row.label(
                 text=f"Missing collection: '{coll_name}'", icon="ERROR")
 
+    @profiled
     def draw(self, context):
-        armature = get_ponyrig()
+        armature = get_active_ponyrig(context)
 
         """Draw bone collecitons from tuple: 'bone_collections' """
-        for collection in bone_collections:
+        for collection in get_rig_schema(armature).bone_collections:
             self.draw_ponyrig_collections(armature, collection, self.layout)
 
     @classmethod
     def poll(cls, context):
-        return get_ponyrig()
+        return get_active_ponyrig(context)
+
+
+class SnapChain:
+    """A switch property and the bones which are snapped when it's flipped"""
+
+    def __init__(self, rig:Object, prop_owner_name:str, prop_name:str, bones:list[str]):
+        self.rig = rig
+        self.prop_owner = get_pose_bone(rig, prop_owner_name)
+        self.prop_name = prop_name                                             # format: "FK/IK"
+        self.prop_val = resolve_property(self.prop_owner, prop_name)
+        self.bones = bones
+        self.snap_matrix = PoseBuffer.capture(rig, matrices=True).get_matrices(bones)    # Get current matrix before snapping
+
+    def can_snap(self) -> bool:
+        return not (self.prop_name == "FK/IK" and self.prop_val == 0)          # FK to IK is snapped by IKSnapChain
+
+    def get_snap_matrices(self) -> dict[str, Matrix]:
+        return self.snap_matrix
+
+    def get_source_bones(self) -> set[str]:
+        """Bones whose keys change the snapped result"""
+        return get_source_bones(self.rig, self.bones)
+
+    def get_keyed_frames(self, frame_start:int, frame_end:int) -> set[int]:
+        switch_path = f'{self.prop_owner.path_from_id()}["{self.prop_name}"]'
+        return get_keyed_frames(self.rig, self.get_source_bones(), {switch_path}, frame_start, frame_end)
 
+    def flip(self):
+        self.prop_owner[self.prop_name] = float(self.prop_val == 0.0)
+        self.rig.update_tag()                                                   # Writing an ID property doesn't tag the rig
 
-class POSE_OT_snap_bake(Operator):
+    def snap(self):
+        snap_matrix = self.get_snap_matrices()
+        self.flip()
+        bpy.context.view_layer.update()                                         # Parents re-evaluate with the flipped switch
+        snap_bones_to_matrices(self.rig, snap_matrix)
+
+    def keyframe(self, writer:FCurveWriter, keying_set:list[str], frame:int):
+        writer.add_bone_property(self.prop_owner, self.prop_name, frame)
+        writer.add_bones(self.rig, self.bones, keying_set, frame)
+
+
+class IKSnapChain(SnapChain):
+    """
+    Snap IK controls to the FK chain when switching from FK to IK.
+    Matrices are computed in closed form from the FK bones on every frame, see compute_fk_matrices().
     """
-    Snap and bake FK bones to IK bones or FK to itself.
-    TODO: Snap IK to FK"""
 
-    bl_idname = 'pose.ponyrig_snap_bake'
-    bl_label = 'Snap & Bake Bones'
-    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
+    def __init__(self, rig:Object, prop_owner_name:str, prop_name:str, targets:dict[str, str], pole:tuple[str, str, str]|None):
+        self.rig = rig
+        self.prop_owner = get_pose_bone(rig, prop_owner_name)
+        self.prop_name = prop_name
+        self.prop_val = resolve_property(self.prop_owner, prop_name)
+        self.targets = targets                                                 # IK control -> followed FK bone
+        self.pole = pole                                                       # (pole control, upper FK bone, lower FK bone)
+        self.bones = [*targets, pole[0]] if pole else list(targets)
+        self.fk_bones = [*targets.values(), *pole[1:]] if pole else list(targets.values())
+
+    def can_snap(self) -> bool:
+        pose_bones = self.rig.pose.bones
+        return self.prop_val == 0 and all(bone_name in pose_bones for bone_name in self.bones + self.fk_bones)
+
+    def get_source_bones(self) -> set[str]:
+        return get_source_bones(self.rig, self.fk_bones)
+
+    def get_snap_matrices(self) -> dict[str, Matrix]:
+        bones = self.rig.data.bones
+        fk_matrices = compute_fk_matrices(self.rig, self.fk_bones)
+
+        snap_matrix = {
+            ik_name: fk_matrices[fk_name] @ bones[fk_name].matrix_local.inverted() @ bones[ik_name].matrix_local
+            for ik_name, fk_name in self.targets.items()
+        }
+        if self.pole:
+            snap_matrix[self.pole[0]] = compute_pole_matrix(self.rig, *self.pole, fk_matrices)
+        return snap_matrix
+
+
+def get_snap_chain_error(rig:Object, prop_owner_name:str, prop_name:str, bones:list[str]) -> str:
+    """Reason why rig can't snap the chain, empty if it has the switch and all bones"""
+
+    prop_owner = get_pose_bone(rig, prop_owner_name)
+    if prop_owner is None:
+        return f"missing bone '{prop_owner_name}'"
+    if prop_owner.get(prop_name) is None:
+        return f"missing property '{prop_name}' in '{prop_owner_name}'"
+    missing = [bone_name for bone_name in bones if bone_name not in rig.pose.bones]
+    if missing:
+        return f"missing bones {', '.join(missing)}"
+    return ""
+
+
+def create_snap_chain(rig:Object, prop_owner_name:str, prop_name:str, bones:list[str]) -> SnapChain:
+    """Snap FK to IK with the given bones, or IK to FK with the IK controls of the rig's schema"""
+
+    chain = SnapChain(rig, prop_owner_name, prop_name, bones)
+    ik = get_rig_schema(rig).ik_snap.get(prop_owner_name)
+    if chain.can_snap() or ik is None or prop_name != "FK/IK":
+        return chain
+    return IKSnapChain(rig, prop_owner_name, prop_name, *ik)
+
+
+class SnapBakeJob:
+    """Snap and bake any number of chains in a single sweep over the frame range"""
+
+    keying_set = ["location", "rotation_quaternion", "scale"]
+
+    def __init__(self, context:Context, chains:list[SnapChain], frame_start:int, frame_end:int,
+                 key_before_start=True, key_after_end=True, rig_only=False, tolerance:float|None=None,
+                 reduce_tolerance:float|None=None, keyed_only=False, substeps=0):
+        self.context = context
+        self.chains = chains
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.key_before_start = key_before_start
+        self.key_after_end = key_after_end
+        self.rig_only = rig_only
+        self.rigs = list({chain.rig: None for chain in chains})
+        self.writers = {rig: FCurveWriter(rig, tolerance) for rig in self.rigs}    # Keys are written once after the frame sweep
+        self.reduce_tolerance = reduce_tolerance                                 # Reduce baked keys within this error, if set
+        self.frames = self.get_bake_frames(substeps) if keyed_only else list(range(frame_start, frame_end+1))
+
+    def keyframe(self, frame:int):
+        for chain in self.chains:
+            chain.keyframe(self.writers[chain.rig], self.keying_set, frame)
+
+    def snap_frame(self, frame:int):
+        """Snap all chains on current frame with one view layer update after flipping their switches"""
+
+        snap_matrices = {rig: {} for rig in self.rigs}
+        for chain in self.chains:
+            snap_matrices[chain.rig].update(chain.get_snap_matrices())
+            chain.flip()
+        self.context.view_layer.update()
+        for rig, snap_matrix in snap_matrices.items():
+            snap_bones_to_matrices(rig, snap_matrix)
+
+        self.keyframe(frame)
+
+    def get_isolation(self):
+        if not self.rig_only:
+            return nullcontext()
+
+        dependencies = set()
+        for rig in self.rigs:
+            dependencies |= get_rig_dependencies(rig)
+        return isolate_evaluation(self.context, dependencies)
+
+    def get_bake_frames(self, substeps:int) -> list[int]:
+        """
+        Frames where a source of any chain is keyed, with the range ends.
+        Each gap between them gets substeps evenly spaced breakdown frames.
+        """
+        keyed = {self.frame_start, self.frame_end}
+        for chain in self.chains:
+            keyed |= chain.get_keyed_frames(self.frame_start, self.frame_end)
+
+        frames = sorted(keyed)
+        if substeps > 0 and len(frames) > 1:
+            starts, gaps = np.array(frames[:-1]), np.diff(frames)
+            steps = np.arange(1, substeps+1) / (substeps+1)
+            breakdowns = np.rint(starts[:, None] + gaps[:, None] * steps).astype(np.int64)
+            frames = sorted(keyed | set(breakdowns.ravel().tolist()))
+        return frames
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.frames)
+
+    def start(self):
+        """Key the frames around the range, the sweep is then done by step()"""
+
+        scene = self.context.scene
+        self.active_frame = scene.frame_current
+        self.frame_index = 0
+        self.poses = {rig: PoseBuffer.capture(rig) for rig in self.rigs}    # Restored on cancel
+        self.isolation = ExitStack()                                           # Closed by finish() or cancel()
+        self.isolation.enter_context(self.get_isolation())
+
+        try:
+            if self.key_before_start:
+                scene.frame_set(self.frame_start-1)
+                self.keyframe(scene.frame_current)
+                scene.frame_set(self.active_frame)
+            if self.key_after_end:
+                self.keyframe(self.frame_end+1)
+        except BaseException:
+            self.cancel()
+            raise
+
+    def step(self, time_budget:float=float('inf')) -> bool:
+        """Bake frames until time_budget seconds passed, return True once the range is done"""
+
+        scene = self.context.scene
+        deadline = time.perf_counter() + time_budget
+
+        while self.frame_index < len(self.frames):
+            """Baking"""
+            frame = self.frames[self.frame_index]
+            scene.frame_set(frame)
+            self.snap_frame(frame)
+            self.frame_index += 1
+            if time.perf_counter() >= deadline:
+                break
+
+        return self.frame_index >= len(self.frames)
+
+    def finish(self):
+        try:
+            for rig, writer in self.writers.items():
+                fcurves = writer.write()
+                if self.reduce_tolerance is not None:
+                    """Keys next to the range are kept, they hold the pose outside of it"""
+                    reduce_keyframes(rig, self.reduce_tolerance, fcurves, frame_range=(self.frame_start, self.frame_end), remove_static=False)
+        finally:
+            self.isolation.close()
+            self.context.scene.frame_set(self.active_frame)
+
+    def cancel(self):
+        """Drop collected keys and put back the pose and switch values from before the bake"""
+
+        try:
+            for writer in self.writers.values():
+                writer.channels.clear()
+            for rig, pose in self.poses.items():
+                pose.restore(rig, properties=False)
+            for chain in self.chains:
+                chain.prop_owner[chain.prop_name] = chain.prop_val
+        finally:
+            self.isolation.close()
+            self.context.scene.frame_set(self.active_frame)
+
+    def run(self):
+        self.start()
+        try:
+            self.step()
+        except BaseException:
+            self.cancel()
+            raise
+        self.finish()
+
+
+class MultiRigOptions:
+    """Let an operator run over every selected rig in one call"""
+
+    all_selected: BoolProperty(
+        name="All Selected Rigs",
+        description="Affect all selected rigs instead of only the active rig",
+        default=False,
+    )                                                  # type: ignore
+
+    def get_rigs(self, context:Context) -> list[Object]:
+        if self.all_selected:
+            return get_selected_ponyrigs(context)
+        rig = get_active_ponyrig(context)
+        return [rig] if rig else []
+
+
+class KeyingOptions:
+    """Change aware keying properties shared by keying operators"""
+
+    only_changed: BoolProperty(
+        name="Only Changed",
+        description="Only insert keyframes on channels whose value differs from what the existing F-curve evaluates to",
+        default=False,
+    )                                                  # type: ignore
+    tolerance: FloatProperty(
+        name="Tolerance",
+        description="Values closer than this to the existing F-curve are not keyed",
+        default=0.0001,
+        min=0.0,
+        precision=5,
+    )                                                  # type: ignore
+
+    def get_tolerance(self) -> float | None:
+        return self.tolerance if self.only_changed else None
+
+    def draw_keying_options(self, layout:UILayout):
+        row = layout.row(align=True)
+        row.prop(self, 'only_changed')
+        sub = row.row(align=True)
+        sub.active = self.only_changed
+        sub.prop(self, 'tolerance')
+
+
+class SnapBakeOptions(MultiRigOptions, KeyingOptions):
+    """Bake properties shared by Snap & Bake operators"""
 
     do_bake: BoolProperty(name="Bake", default=False)  # type: ignore
     frame_start: IntProperty(name="Start Frame")       # type: ignore
@@ -302,6 +2436,151 @@ class POSE_OT_snap_bake(Operator):
         name="Key After End",
         description="Insert a keyframe of the original values one frame after the bake range. This is to avoid undesired interpolation after the bake",
     )                                                  # type: ignore
+    rig_only: BoolProperty(
+        name="Rig Only",
+        description="Only evaluate the rig and its constraint and driver targets while baking. Other objects are disabled in viewports until the bake is done",
+        default=False,
+    )                                                  # type: ignore
+    use_modal: BoolProperty(
+        name="In Background",
+        description="Bake in small chunks between redraws, with progress in the status bar. Press Esc to cancel",
+        default=False,
+    )                                                  # type: ignore
+
+    bake_frames: EnumProperty(
+        name="Frames",
+        items=[
+            ('ALL', "Every Frame", "Snap and key every frame of the range"),
+            ('KEYED', "Keyed Frames", "Only snap and key frames where the controls moving the chain or its switch are keyed"),
+        ],
+        default='ALL',
+    )                                                  # type: ignore
+    substeps: IntProperty(
+        name="Breakdowns",
+        description="Extra evenly spaced frames baked between each pair of keyed frames",
+        default=0,
+        min=0,
+        soft_max=8,
+    )                                                  # type: ignore
+    reduce_keys: BoolProperty(
+        name="Reduce Keys",
+        description="Remove baked keys which the curve can do without, within the max error",
+        default=False,
+    )                                                  # type: ignore
+    reduce_tolerance: FloatProperty(
+        name="Max Error",
+        description="Largest difference to the baked values that key reduction may introduce",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )                                                  # type: ignore
+
+    """Seconds of baking between redraws of a modal bake"""
+    modal_time_budget = 0.05
+
+    def run_snap_bake(self, context:Context, chains:list[SnapChain]) -> set[str]:
+        if not self.do_bake:
+            for chain in chains:
+                chain.snap()
+            return {'FINISHED'}
+
+        job = SnapBakeJob(
+            context, chains,
+            self.frame_start, self.frame_end,
+            key_before_start=self.key_before_start,
+            key_after_end=self.key_after_end,
+            rig_only=self.rig_only,
+            tolerance=self.get_tolerance(),
+            reduce_tolerance=self.reduce_tolerance if self.reduce_keys else None,
+            keyed_only=self.bake_frames == 'KEYED',
+            substeps=self.substeps,
+        )
+        if not self.use_modal or context.window is None:
+            job.run()
+            return {'FINISHED'}
+
+        self._job = job
+        job.start()
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, job.frame_count)
+        self._timer = window_manager.event_timer_add(0.001, window=context.window)
+        window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def end_modal(self, context:Context):
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self._timer)
+        window_manager.progress_end()
+        context.workspace.status_text_set(None)
+
+    def modal(self, context, event):
+        job = self._job
+
+        if event.type in {'ESC', 'RIGHTMOUSE'} and event.value == 'PRESS':
+            try:
+                job.cancel()
+            finally:
+                self.end_modal(context)
+            self.report({'INFO'}, "Snap & Bake cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        try:
+            done = job.step(self.modal_time_budget)
+            baked = job.frame_index
+            context.window_manager.progress_update(baked)
+            context.workspace.status_text_set(f"Snap & Bake: frame {baked}/{job.frame_count}, Esc to cancel")
+
+            if not done:
+                return {'RUNNING_MODAL'}
+            job.finish()
+        except BaseException:
+            """Don't leave objects disabled or the timer and progress running"""
+            try:
+                job.cancel()
+            finally:
+                self.end_modal(context)
+            raise
+
+        self.end_modal(context)
+        return {'FINISHED'}
+
+    def draw_bake_options(self, layout:UILayout):
+        """Referenced from CloudRig"""
+        layout.prop(self, 'do_bake')
+        split = layout.split(factor=0.1)
+        split.row()
+        col = split.column()
+        if self.do_bake:
+            time_row = col.row(align=True)
+            time_row.prop(self, 'frame_start')
+            time_row.prop(self, 'frame_end')
+            fix_row = col.row(align=True)
+            fix_row.prop(self, 'key_before_start')
+            fix_row.prop(self, 'key_after_end')
+            frames_row = col.row(align=True)
+            frames_row.prop(self, 'bake_frames', text="")
+            sub = frames_row.row(align=True)
+            sub.active = self.bake_frames == 'KEYED'
+            sub.prop(self, 'substeps')
+            col.prop(self, 'rig_only')
+            col.prop(self, 'use_modal')
+            self.draw_keying_options(col)
+            row = col.row(align=True)
+            row.prop(self, 'reduce_keys')
+            sub = row.row(align=True)
+            sub.active = self.reduce_keys
+            sub.prop(self, 'reduce_tolerance')
+        layout.prop(self, 'all_selected')
+
+
+class POSE_OT_snap_bake(SnapBakeOptions, Operator):
+    """Snap and bake FK bones to IK bones, IK controls to FK bones or FK to itself"""
+
+    bl_idname = 'pose.ponyrig_snap_bake'
+    bl_label = 'Snap & Bake Bones'
+    bl_options = {'REGISTER', 'UNDO', 'INTERNAL'}
 
     prop_owner_name: StringProperty(
         description="Bone with FK/IK or something similar switch property"
@@ -313,125 +2592,137 @@ class POSE_OT_snap_bake(Operator):
         description="'List[str]' of FK bone for snapping FK to IK"
     )                                                  # type: ignore
 
-    def get_matrix(self, rig:Object, bone_list:list[str]) -> list:
-        """Stores the current view transformation matrix of each bone"""
-        snap_matrix = []
+    @profiled
+    def execute(self, context):
+        affect_bones = ast.literal_eval(self.affect_bones)                     # convert '[str]' to [str]
+        chains = []
+        skipped = []
 
-        for bone_name in bone_list:
-            bone = rig.pose.bones.get(bone_name)
-            snap_matrix.append(bone.matrix.copy())
+        for rig in self.get_rigs(context):
+            error = get_snap_chain_error(rig, self.prop_owner_name, self.prop_name, affect_bones)
+            if error:
+                skipped.append(f"{rig.name}: {error}")
+                continue
+            chain = create_snap_chain(rig, self.prop_owner_name, self.prop_name, affect_bones)
+            if chain.can_snap():
+                chains.append(chain)
+            else:
+                skipped.append(f"{rig.name}: {self.prop_owner_name} in FK mode without IK controls")
+
+        if skipped:
+            self.report({'WARNING'}, f"Skipped chains: {'; '.join(skipped)}")
+        if not chains:
+            return {'CANCELLED'}
 
-        return snap_matrix
+        return self.run_snap_bake(context, chains)
 
-    def snap_bones_to_matrix(self, rig:Object, bones:list[str], snap_matix:list):
-        for i, bone_name in enumerate(bones):
-            bone = rig.pose.bones.get(bone_name)
-            bone.matrix = snap_matix[i]
-            bpy.context.view_layer.update()
-            bone.matrix = snap_matix[i]
+    def invoke(self, context, event):
+        self.frame_start = context.scene.frame_current
+        self.frame_end = context.scene.frame_current
+        self.do_bake = False
+        self.key_before_start = True
+        self.key_after_end = True
 
-    @classmethod
-    def keyframe_bones(self, rig:Object, bone_map:list[str]|list[list], keying_set:list[str], frame:int):
-        """Keyframe the given attributes for each bone at the specified frame"""
+        return context.window_manager.invoke_props_dialog(self)
 
-        for bone in bone_map:
-            if type(bone) == str:
-                pose_bone = rig.pose.bones.get(bone)
-            elif type(bone) == list:
-                pose_bone = rig.pose.bones.get(bone[0])
-
-            """Check if prop_id contains rotation property and change it to pose bone's current rotation_mode"""
-            rot_index = next((i for i, s in enumerate(keying_set) if re.compile(r"^rotation.*").match(s)), None)
-            if rot_index != None:
-                if pose_bone.rotation_mode in ['QUATERNION', 'AXIS_ANGLE']:
-                    keying_set[rot_index] = f"rotation_{pose_bone.rotation_mode.lower()}"
-                else:
-                    keying_set[rot_index] = "rotation_euler"
+    def draw_affected_bones(self, rig:Object, bone_map:list[str], prop_name:str, layout:UILayout):
+        prop_owner = get_pose_bone(rig, self.prop_owner_name)
 
-            """Insert keyframe"""
-            for prop in keying_set:
-                pose_bone.keyframe_insert(data_path=f"{prop}", frame=frame)
+        if (self.prop_name == "FK/IK" and prop_owner[prop_name] > 0) or (self.prop_name != "FK/IK"):
+            column = layout.column(align=True)
+            column.label(text="Snapped bones:")
 
-    def execute(self, context):
-        rig = get_ponyrig()
-        affect_bones = ast.literal_eval(self.affect_bones)                     # convert '[str]' to [str]
-        prop_owner = rig.pose.bones.get(self.prop_owner_name)
-        prop_name = self.prop_name                                             # format: "FK/IK"
-        prop_val = prop_owner.path_resolve(f'["{prop_name}"]')
-        keying_set = ["location", "rotation_quaternion", "scale"]
-        snap_matrix = self.get_matrix(rig, affect_bones)                       # Get current matrix before snapping
+            for from_bone in bone_map:
+                column.label(text=f"{' '*10} {from_bone} -> {from_bone}")
+        elif self.prop_owner_name in get_rig_schema(rig).ik_snap:
+            targets, pole = get_rig_schema(rig).ik_snap[self.prop_owner_name]
+            column = layout.column(align=True)
+            column.label(text="Snapped IK controls:")
 
-        if self.prop_name == "FK/IK" and prop_val == 0: return {'CANCELLED'}   # Snap IK to FK isn't support yet.
+            for ik_bone, fk_bone in targets.items():
+                column.label(text=f"{' '*10} {ik_bone} -> {fk_bone}")
+            if pole:
+                column.label(text=f"{' '*10} {pole[0]} -> {pole[1]}, {pole[2]}")
+        else:
+            row = layout.row()
+            row.alert = True
+            row.label(text="No IK controls to snap in the rig's schema", icon='ERROR')
 
-        if self.do_bake:
-            active_frame = context.scene.frame_current
+    def draw(self, context):
+        layout = self.layout
+        rig = get_active_ponyrig(context)
+        bone_map = ast.literal_eval(self.affect_bones)
 
-            if self.key_before_start:
-                context.scene.frame_set(self.frame_start-1)
-                frame_current = context.scene.frame_current
+        self.draw_bake_options(layout)
+        self.draw_affected_bones(rig, bone_map, prop_name=self.prop_name, layout=layout)
 
-                prop_owner.keyframe_insert(f'["{prop_name}"]', frame=frame_current)
-                self.keyframe_bones(rig, affect_bones, keying_set, frame_current)
 
-                context.scene.frame_set(active_frame)
-            if self.key_after_end:
-                prop_owner.keyframe_insert(f'["{prop_name}"]', frame=self.frame_end+1)
-                self.keyframe_bones(rig, affect_bones, keying_set, self.frame_end+1)
+def get_snap_chain_items(self, context) -> list[tuple]:
+    """Chains of the rig's schema, the schema keeps the item strings alive"""
 
-            for frame in range(self.frame_start, self.frame_end+1):
-                """Baking"""
-                context.scene.frame_set(frame)
+    rig = get_active_ponyrig(context)
+    return get_rig_schema(rig).snap_chain_items if rig else []
 
-                prop_owner[prop_name] = float(prop_val == 0.0)
-                self.snap_bones_to_matrix(rig, affect_bones, snap_matrix)
-                self.keyframe_bones(rig, affect_bones, keying_set, frame)
-                prop_owner.keyframe_insert(f'["{prop_name}"]', frame=frame)
 
-            context.scene.frame_set(active_frame)
-        else:
-            prop_owner[prop_name] = float(prop_val == 0.0)
-            self.snap_bones_to_matrix(rig, affect_bones, snap_matrix)
+class POSE_OT_snap_bake_chains(SnapBakeOptions, Operator):
+    """Snap and bake several chains in one pass over the frame range"""
 
-        return {'FINISHED'}
+    bl_idname = 'pose.ponyrig_snap_bake_chains'
+    bl_label = 'Snap & Bake Chains'
+    bl_options = {'REGISTER', 'UNDO'}
 
-    def invoke(self, context, event):
-        self.frame_start = context.scene.frame_current
-        self.frame_end = context.scene.frame_current
-        self.do_bake = False
-        self.key_before_start = True
-        self.key_after_end = True
+    chains: EnumProperty(
+        name="Chains",
+        items=get_snap_chain_items,
+        options={'ENUM_FLAG'},
+        description="Chains to snap and bake",
+    )                                                  # type: ignore
 
-        return context.window_manager.invoke_props_dialog(self)
+    @profiled
+    def execute(self, context):
+        chains = []
+        skipped = []
+
+        for rig in self.get_rigs(context):
+            snap_chains = get_rig_schema(rig).snap_chains
+            for chain_id in self.chains:
+                if chain_id not in snap_chains:
+                    continue
+                label, prop_owner_name, prop_name, bones = snap_chains[chain_id]
+                error = get_snap_chain_error(rig, prop_owner_name, prop_name, bones)
+                if error:
+                    skipped.append(f"{rig.name}: {label}, {error}")
+                    continue
+                chain = create_snap_chain(rig, prop_owner_name, prop_name, bones)
+                if chain.can_snap():
+                    chains.append(chain)
+                else:
+                    skipped.append(f"{rig.name}: {label} in FK mode without IK controls")
 
-    def draw_affected_bones(self, rig:Object, bone_map:list[str], prop_name:str, layout:UILayout):
-        prop_owner = rig.pose.bones.get(self.prop_owner_name)
+        if skipped:
+            self.report({'WARNING'}, f"Skipped chains: {'; '.join(skipped)}")
+        if not chains:
+            return {'CANCELLED'}
 
-        if (self.prop_name == "FK/IK" and prop_owner[prop_name] > 0) or (self.prop_name != "FK/IK"):
-            column = layout.column(align=True)
-            column.label(text="Snapped bones:")
+        return self.run_snap_bake(context, chains)
+
+    def invoke(self, context, event):
+        self.frame_start = context.scene.frame_start
+        self.frame_end = context.scene.frame_end
+        self.do_bake = True
+        self.key_before_start = True
+        self.key_after_end = True
 
-            for from_bone in bone_map:
-                column.label(text=f"{' '*10} {from_bone} -> {from_bone}")
+        return context.window_manager.invoke_props_dialog(self)
 
     def draw(self, context):
         layout = self.layout
-        rig = get_ponyrig()
-        bone_map = ast.literal_eval(self.affect_bones)
 
-        """Referenced from CloudRig"""
-        layout.prop(self, 'do_bake')
-        split = layout.split(factor=0.1)
-        split.row()
-        col = split.column()
-        if self.do_bake:
-            time_row = col.row(align=True)
-            time_row.prop(self, 'frame_start')
-            time_row.prop(self, 'frame_end')
-            fix_row = col.row(align=True)
-            fix_row.prop(self, 'key_before_start')
-            fix_row.prop(self, 'key_after_end')
+        column = layout.column(align=True)
+        column.label(text="Chains:")
+        column.prop(self, 'chains')
 
-        self.draw_affected_bones(rig, bone_map, prop_name=self.prop_name, layout=layout)
+        self.draw_bake_options(layout)
 
 
 class PONY_PT_bone_properties(PonyRigPanel, Panel):
@@ -441,6 +2732,7 @@ class PONY_PT_bone_properties(PonyRigPanel, Panel):
     bl_label = 'FK/IK Switch'
 
     def draw_bone_props(self, armature:Object, prop_owner:list[str], prop_name:str, layout:UILayout, snap_bake:bool=False):
+        schema = get_rig_schema(armature)
         box = layout.box()
         row = box.row()
         row_index = -1
@@ -456,45 +2748,48 @@ class PONY_PT_bone_properties(PonyRigPanel, Panel):
             draw_bone_property(
                 sub_row,
                 armature, bone_name, prop_name, 
-                slider_name=bone_alias[bone_name]
+                slider_name=schema.bone_alias.get(bone_name, bone_name)
             )
             if snap_bake:
                 """Draw 'Snap & Bake' operator at the end of each slider"""
                 op = sub_row.operator('pose.ponyrig_snap_bake', text="", icon='FILE_REFRESH')
                 op.prop_owner_name = bone_name
                 op.prop_name = prop_name
-                op.affect_bones = f"{bone_affect[bone_name]}"
+                op.affect_bones = schema.bone_affect_repr[bone_name]
 
+    @profiled
     def draw(self, context):
         layout = self.layout
-        armature = get_ponyrig()
+        armature = get_active_ponyrig(context)
 
         if armature.type == 'ARMATURE':
-            self.draw_bone_props(armature, prop_limbs, "FK/IK", layout, snap_bake=True)
-            self.draw_bone_props(armature, prop_hairs, "FK/IK", layout, snap_bake=True)
+            schema = get_rig_schema(armature)
+            self.draw_bone_props(armature, schema.prop_limbs, "FK/IK", layout, snap_bake=True)
+            self.draw_bone_props(armature, schema.prop_hairs, "FK/IK", layout, snap_bake=True)
+            layout.operator('pose.ponyrig_snap_bake_chains', icon='FILE_REFRESH')
+            if not schema.ik_snap:
+                """IK control names differ per rig, the default schema can't snap FK to IK"""
+                layout.label(text="Snapping FK to IK needs 'ik_snap' entries in the rig's schema", icon='INFO')
 
     @classmethod
     def poll(cls, context):
-        return get_ponyrig()
+        return get_active_ponyrig(context)
 
 
 class PONY_PT_fk_properties(PonyRigPanel, Panel):
     bl_parent_id = 'PONY_PT_MAIN'
     bl_label = 'FK'
 
+    @profiled
     def draw(self, context):
-        rig = get_ponyrig()
+        rig = get_active_ponyrig(context)
         layout = self.layout
-        prop = {
-            ('properties', 'head_hinge', 'head_ctrl', 'Head'),
-            ('tail_options', 'tail_hinge', 'tailBase_bndJnt1_FK', 'Tail')
-        }
 
         row = layout.row()
         row.label(text="Hinge", translate=False)
 
         """draw FK prop"""
-        for owner, prop, affect_bone, text in prop:
+        for owner, prop, affect_bone, text in get_rig_schema(rig).hinges:
             row = layout.row(align=True)
             draw_bone_property(
                 row, 
@@ -509,58 +2804,100 @@ class PONY_PT_fk_properties(PonyRigPanel, Panel):
 
     @classmethod
     def poll(cls, context):
-        return get_ponyrig()
+        return get_active_ponyrig(context)
 
 
 class PONY_PT_face_properties(PonyRigPanel, Panel):
     bl_parent_id = 'PONY_PT_MAIN'
     bl_label = 'Face'
 
+    @profiled
     def draw(self, context):
         layout = self.layout
-        zipper_prop = {
-            ("L_lipCorner_ctrl", "L_zipper_lip", "L Lip Zipper"),
-            ("R_lipCorner_ctrl", "R_zipper_lip", "R Lip Zipper")
-        }
+        rig = get_active_ponyrig(context)
+        schema = get_rig_schema(rig)
 
         """Draw eyetarget properties"""
+        owner, prop, text, texts = schema.eye_target
         draw_bone_property(
             layout.box(),
-            get_ponyrig(),
-            prop_owner_name='properties',
-            prop_name='eye_target_parents',
-            slider_name="Eye Target Parent",
-            texts=['Master', 'Head', 'COG']
+            rig,
+            prop_owner_name=owner,
+            prop_name=prop,
+            slider_name=text,
+            texts=texts
         )
 
         """Draw lip zipper properties"""
         column = layout.box().column()
-        for owner, prop, text in zipper_prop:
+        for owner, prop, text in schema.zippers:
             draw_bone_property(
                 layout=column,
-                rig=get_ponyrig(),
+                rig=rig,
                 prop_owner_name=owner,
                 prop_name=prop,
                 slider_name=text
             )
 
         """Draw jaw influence prop"""
+        owner, prop, text = schema.jaw
         draw_bone_property(
             layout.box(),
-            get_ponyrig(),
-            prop_owner_name='jaw_ctrl',
-            prop_name='jaw_influence',
-            slider_name="Lip Corner Jaw Influence",
+            rig,
+            prop_owner_name=owner,
+            prop_name=prop,
+            slider_name=text,
         )
 
     @classmethod
     def poll(cls, context):
-        return get_ponyrig()
+        return get_active_ponyrig(context)
+
+
+class PONY_PT_crowd_lod(PonyRigPanel, Panel):
+    bl_parent_id = 'PONY_PT_MAIN'
+    bl_label = 'Crowd Quality'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw_header(self, context):
+        self.layout.prop(context.scene.ponyrig_lod, "use_lod", text="")
+
+    @profiled
+    def draw(self, context):
+        settings = context.scene.ponyrig_lod
+        layout = self.layout
+        layout.use_property_split = True
+
+        column = layout.column()
+        column.active = settings.use_lod
+        column.prop(settings, "metric")
+        column.prop(settings, "distance" if settings.metric == 'DISTANCE' else "screen_size")
+        column.prop(settings, "hysteresis")
+        column.prop(settings, "use_frustum")
+        column.prop(settings, "force_render")
+        column.prop(settings, "render_quality")
+        if context.scene.camera is None:
+            row = layout.row()
+            row.alert = True
+            row.label(text="Scene has no camera", icon="ERROR")
+
+    @classmethod
+    def poll(cls, context):
+        return get_active_ponyrig(context)
 
 
 class PONY_UL_collections(UIList):
     """Draw outline items in a UIList"""
 
+    @staticmethod
+    def get_item_name(item) -> str:
+        """Alias of the outline object or collection if any, otherwise its name"""
+
+        obj = item.collection_ref if item.is_collection else item.object_ref
+        if obj is None:
+            return item.name
+        return obj.get("alias") if obj.get("alias") else obj.name
+
     def draw_item(self, context, layout, data, item, icon, active_data, active_property, index, flt_flag):
         if item.is_collection:
             obj = item.collection_ref
@@ -569,12 +2906,30 @@ class PONY_UL_collections(UIList):
 
         if obj:
             row = layout.row(align=True)
-            obj_name = obj.get("alias") if obj.get("alias") else obj.name
+            obj_name = self.get_item_name(item)
             row.label(text=f"{obj_name} Outline", icon="MOD_SOLIDIFY", translate=False)
 
             row.prop(obj, "hide_viewport", text="", toggle=True, emboss=False)
             row.prop(obj, "hide_render", text="", toggle=True, emboss=False)
 
+    def filter_items(self, context, data, propname):
+        """Filter and sort by the displayed name, inverting is applied by Blender"""
+
+        items = getattr(data, propname)
+        names = [self.get_item_name(item).lower() for item in items]
+
+        if self.filter_name:
+            pattern = f"*{self.filter_name.lower()}*"
+            flags = [self.bitflag_filter_item if fnmatchcase(name, pattern) else 0 for name in names]
+        else:
+            flags = [self.bitflag_filter_item] * len(items)
+
+        order = []
+        if self.use_filter_sort_alpha:
+            order = bpy.types.UI_UL_list.sort_items_helper(list(enumerate(names)), key=lambda item: item[1])
+
+        return flags, order
+
 
 class PONY_PT_magic_outline(PonyRigPanel, Panel):
     """Magic Aura and Outline Control Panel"""
@@ -582,15 +2937,11 @@ class PONY_PT_magic_outline(PonyRigPanel, Panel):
     bl_label = 'Magic & Outline Control'
 
     def draw_magic_panel(self, context, collection_id:str, bone_id:str, bone_prop_id:list[list], layout:UILayout):
-        rig = get_ponyrig()
-        magic_collection = None
-        prop_bone = rig.pose.bones.get(bone_id) if rig.type == 'ARMATURE' else None
+        rig = get_active_ponyrig(context)
+        prop_bone = get_pose_bone(rig, bone_id) if rig.type == 'ARMATURE' else None
 
         """Find collection with given colletion_id"""
-        for collection in bpy.data.collections:
-            if collection.get(collection_id):
-                magic_collection = collection
-                break
+        magic_collection = get_tagged_collection(collection_id)
 
         """Draw viewport and render display attributes"""
         if magic_collection:
@@ -620,12 +2971,13 @@ class PONY_PT_magic_outline(PonyRigPanel, Panel):
                     if n != 0 and n %2 == 0:
                         row = box.row()
 
-                    if prop_bone.get(prop) != None:
-                        if type(prop_bone.get(prop)) == bool:
-                            icon = "HIDE_OFF" if prop_bone.get(prop) else "HIDE_ON"
-                            row.prop(prop_bone, f'["{prop}"]', text=prop, toggle=True, translate=False, icon=icon)
+                    descriptor = get_property_descriptor(rig, bone_id, prop)
+                    if not descriptor.error:
+                        if descriptor.kind == 'BOOL':
+                            icon = "HIDE_OFF" if prop_bone[prop] else "HIDE_ON"
+                            row.prop(prop_bone, descriptor.data_path, text=prop, toggle=True, translate=False, icon=icon)
                         else:
-                            row.prop(prop_bone, f'["{prop}"]', text=prop)
+                            row.prop(prop_bone, descriptor.data_path, text=prop)
                     else:
                         row.alert = True
                         row.label(text=f"Missing property: '{prop}'", icon="ERROR")
@@ -639,14 +2991,10 @@ class PONY_PT_magic_outline(PonyRigPanel, Panel):
             return
 
     def draw_outline(self, context, outline_coll_id:str, layout:UILayout):
-        rig = get_ponyrig()
-        master_coll = None
+        rig = get_active_ponyrig(context)
 
         """Find the main outline collection and draw."""
-        for i in bpy.data.collections:
-            if i.get(f"{outline_coll_id}"):
-                master_coll = i
-                break
+        master_coll = get_tagged_collection(outline_coll_id)
 
         if master_coll != None:
             box = layout.box()
@@ -678,20 +3026,25 @@ class PONY_PT_magic_outline(PonyRigPanel, Panel):
             row.alert = True
             row.label(text=f"Can't find collection with property: '{outline_coll_id}'", icon="ERROR")
 
+    @profiled
     def draw(self, context):
+        if _outline_sync_pending:
+            request_outline_sync()
+
+        schema = get_rig_schema(get_active_ponyrig(context))
         self.draw_magic_panel(
             context, 
-            collection_id="magic_master", 
-            bone_id="magic_ctrl", 
-            bone_prop_id=[["Points", "Sparkles", "Opacity", "Power"], ["Amplitude", "Frequency", "Speed", "Roughness"]],
+            collection_id=schema.magic_collection, 
+            bone_id=schema.magic_bone, 
+            bone_prop_id=schema.magic_props,
             layout=self.layout
         )
 
-        self.draw_outline(context, outline_coll_id='outline_master', layout=self.layout)
+        self.draw_outline(context, outline_coll_id=schema.outline_collection, layout=self.layout)
 
     @classmethod
     def poll(cls, context):
-        return get_ponyrig()
+        return get_active_ponyrig(context)
 
 
 class POSE_OT_update_outline_items(Operator):
@@ -710,37 +3063,51 @@ class POSE_OT_update_outline_items(Operator):
 
     @classmethod
     def run_update(self, rig:Object, collction_id:str) -> bool:
+        """Sync the items with the outline collection, only adding and removing what changed"""
+
         ponyrig_prefs = rig.ponyrig_prefs
-        outline_coll = None
+        outline_coll = get_tagged_collection(collction_id)
 
-        for collection in bpy.data.collections:
-            if collection.get(f'{collction_id}'):
-                outline_coll = collection
-                break
         if outline_coll == None:
             return False
 
-        ponyrig_prefs.outline_items.clear()
-
-        for child_col in outline_coll.children:
-            item = ponyrig_prefs.outline_items.add()
-
-            item.name = child_col.name
-            item.is_collection = True
-            item.collection_ref = child_col
-
-        for child_obj in outline_coll.objects:
-            item = ponyrig_prefs.outline_items.add()
+        outline_items = ponyrig_prefs.outline_items
+        expected = {
+            **{(True, child_col.session_uid): child_col for child_col in outline_coll.children},
+            **{(False, child_obj.session_uid): child_obj for child_obj in outline_coll.objects},
+        }
 
-            item.name = child_obj.name
-            item.is_collection = False
-            item.object_ref = child_obj
+        """Remove items whose reference is gone or no longer in the collection, backwards to keep indices valid"""
+        for index in reversed(range(len(outline_items))):
+            item = outline_items[index]
+            ref = item.collection_ref if item.is_collection else item.object_ref
+            key = (item.is_collection, ref.session_uid) if ref else None
+            if key in expected:
+                del expected[key]
+                if item.name != ref.name:
+                    item.name = ref.name
+            else:
+                outline_items.remove(index)
+
+        for (is_collection, _), ref in expected.items():
+            item = outline_items.add()
+
+            item.name = ref.name
+            item.is_collection = is_collection
+            if is_collection:
+                item.collection_ref = ref
+            else:
+                item.object_ref = ref
+
+        if ponyrig_prefs.active_index >= len(outline_items):
+            ponyrig_prefs.active_index = max(len(outline_items) - 1, 0)
 
         return True
 
+    @profiled
     def execute(self, context):
         outline_id = self.collection_id
-        rig = get_ponyrig()
+        rig = get_active_ponyrig(context, self.rig_id)
 
         if rig and self.run_update(rig, outline_id):
             self.report({'INFO'}, f"Updated and store outline items into object: '{rig.name}'.")
@@ -780,6 +3147,7 @@ class OBJECT_OT_config_solid_shading(Operator):
 
         return {'FINISHED'}
 
+    @profiled
     def execute(self, context):
         shader_config = {
             "light": "MATCAP",
@@ -792,47 +3160,62 @@ class OBJECT_OT_config_solid_shading(Operator):
         return self.config_solid_shading(context, shader_config)
 
 
-class POSE_OT_ponyrig_keyframe_all_ctrl_bones(Operator):
+class POSE_OT_ponyrig_keyframe_all_ctrl_bones(MultiRigOptions, KeyingOptions, Operator):
     """Keyframe all control bones"""
 
     bl_idname = 'pose.ponyrig_keyframe_all_ctrl_bones'
     bl_label = 'Keyframe All Ctrl Bones'
     bl_options = {'REGISTER', 'UNDO'}
 
-    def keyframe_bone_from_collections(self, rig:Object, excluded_collections:list[str], keying_set:list[str], frame:int):
-        armature = bpy.data.armatures.get(rig.name)
-
-        for collection in armature.collections:
-            if collection.name in excluded_collections:
-                continue
-
-            for bone in collection.bones_recursive:
-                pose_bone = rig.pose.bones.get(bone.name)
-
-                """Check if prop_id contains rotation property and change it to pose bone's current rotation_mode"""
-                rot_index = next((i for i, s in enumerate(keying_set) if re.compile(r"^rotation.*").match(s)), None)
-                if rot_index != None:
-                    if pose_bone.rotation_mode in ['QUATERNION', 'AXIS_ANGLE']:
-                        keying_set[rot_index] = f"rotation_{pose_bone.rotation_mode.lower()}"
-                    else:
-                        keying_set[rot_index] = "rotation_euler"
+    frame_mode: EnumProperty(
+        name="Frames",
+        items=[
+            ('CURRENT', "Current Frame", "Keyframe the current frame"),
+            ('RANGE', "Frame Range", "Keyframe every frame of the scene or preview range"),
+            ('MARKERS', "Markers", "Keyframe every frame with a timeline marker"),
+        ],
+        default='CURRENT',
+    )                                                  # type: ignore
 
-                """Insert keyframe"""
-                for prop in keying_set:
-                    pose_bone.keyframe_insert(data_path=f"{prop}", frame=frame)
+    def get_frames(self, scene) -> list[int]:
+        if self.frame_mode == 'RANGE':
+            if scene.use_preview_range:
+                return list(range(scene.frame_preview_start, scene.frame_preview_end+1))
+            return list(range(scene.frame_start, scene.frame_end+1))
+        elif self.frame_mode == 'MARKERS':
+            return sorted({marker.frame for marker in scene.timeline_markers})
+        return [scene.frame_current]
 
+    @profiled
     def execute(self, context):
-        rig = get_ponyrig()
-        keying_set = ["location", "rotation_quaternion", "scale"]
-        current_frame = context.scene.frame_current
-        excluded_collections = {'Rigging'}
-
-        self.keyframe_bone_from_collections(rig, excluded_collections, keying_set, current_frame)
+        scene = context.scene
+        active_frame = scene.frame_current
+        rigs = self.get_rigs(context)
+        keyers = [CtrlBoneKeyer.get(rig) for rig in rigs]
+        writers = [FCurveWriter(rig, self.get_tolerance()) for rig in rigs]
+
+        for frame in self.get_frames(scene):
+            if frame != scene.frame_current:
+                scene.frame_set(frame)
+            for keyer, writer in zip(keyers, writers):
+                keyer.keyframe(writer, frame)
+
+        for writer in writers:
+            writer.write()
+        if scene.frame_current != active_frame:
+            scene.frame_set(active_frame)
 
         return {'FINISHED'}
 
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, 'frame_mode')
+        self.draw_keying_options(layout)
+        layout.prop(self, 'all_selected')
+
 
-class POSE_OT_ponyrig_reset(Operator):
+class POSE_OT_ponyrig_reset(MultiRigOptions, Operator):
     """Reset bones transforms to their default values"""
 
     bl_idname = 'pose.ponyrig_rest'
@@ -842,23 +3225,22 @@ class POSE_OT_ponyrig_reset(Operator):
     reset_transforms: BoolProperty(
         name="Transforms", default=True, description="Reset bone transforms"
     ) # type: ignore
+    reset_properties: BoolProperty(
+        name="Properties", default=True, description="Reset rig properties such as FK/IK, hinges and face controls to their defaults"
+    ) # type: ignore
     selection_only: BoolProperty(
         name="Selected Only",
         default=False,
         description="Affect selected bones rather than all bones",
     ) # type: ignore
 
-    def reset_rig(self, rig:Object, reset_transforms=True, pbones=[]):
-        # TODO: Add reset bone properties
+    def reset_rig(self, rig:Object, reset_transforms=True, reset_properties=True, pbones=None):
+        bone_names = [pb.name for pb in pbones] if pbones else None       # None for all bones
 
-        if not pbones:
-            pbones = rig.pose.bones
-        for pb in pbones:
-            if reset_transforms:
-                pb.location = (0, 0, 0)
-                pb.rotation_euler = (0, 0, 0)
-                pb.rotation_quaternion = (1, 0, 0, 0)
-                pb.scale = (1, 1, 1)
+        if reset_transforms:
+            reset_bone_transforms(rig, bone_names)
+        if reset_properties:
+            reset_rig_properties(rig, None if bone_names is None else set(bone_names))
 
     def invoke(self, context, event):
         wm = context.window_manager
@@ -871,56 +3253,569 @@ class POSE_OT_ponyrig_reset(Operator):
         # col.prop(self, "reset_transforms")
 
         col = layout.column()
+        col.prop(self, "reset_properties")
         col.prop(self, "selection_only")
+        col.prop(self, "all_selected")
 
+    @profiled
     def execute(self, context):
-        rig = get_ponyrig()
-        pbones = rig.pose.bones
-        if self.selection_only:
-            pbones = context.selected_pose_bones
+        for rig in self.get_rigs(context):
+            pbones = None   # None for all bones, keeps reset_bone_transforms() on its rest pose fast path
+            if self.selection_only:
+                pbones = [pb for pb in context.selected_pose_bones or [] if pb.id_data == rig]
+                if not pbones and self.all_selected:
+                    """Don't reset whole rigs which just have no selected bones"""
+                    continue
+
+            self.reset_rig(
+                rig,
+                reset_transforms = self.reset_transforms,
+                reset_properties = self.reset_properties,
+                pbones = pbones
+            )
 
-        self.reset_rig(
-            rig,
-            reset_transforms = self.reset_transforms,
-            pbones = pbones
-        )
+        return {'FINISHED'}
+
+
+class POSE_OT_ponyrig_reduce_keys(MultiRigOptions, Operator):
+    """Remove redundant keys from the rig's action and drop channels which stay at rest"""
+
+    bl_idname = 'pose.ponyrig_reduce_keys'
+    bl_label = 'Reduce Keys'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    tolerance: FloatProperty(
+        name="Max Error",
+        description="Largest difference to the original curve that key reduction may introduce",
+        default=0.001,
+        min=0.0,
+        precision=4,
+    )                                                  # type: ignore
+    remove_static: BoolProperty(
+        name="Remove Static Channels",
+        description="Remove transform curves which stay at the rest value",
+        default=True,
+    )                                                  # type: ignore
+
+    @profiled
+    def execute(self, context):
+        rigs = self.get_rigs(context)
+        if not rigs:
+            return {'CANCELLED'}
+
+        removed_keys = removed_curves = 0
+        for rig in rigs:
+            keys, curves = reduce_keyframes(rig, self.tolerance, remove_static=self.remove_static)
+            removed_keys += keys
+            removed_curves += curves
+
+        self.report({'INFO'}, f"Removed {removed_keys} keys and {removed_curves} static curves")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
+class POSE_OT_ponyrig_cache_export(Operator, ExportHelper):
+    """Evaluate the rig over a frame range and save the local transforms of its bones into a transform cache"""
+
+    bl_idname = 'pose.ponyrig_cache_export'
+    bl_label = "Export Transform Cache"
+    bl_options = {'REGISTER'}
+
+    filename_ext = ".ponycache"
+    filter_glob: StringProperty(default="*.ponycache", options={'HIDDEN'}) # type: ignore
+
+    bones: EnumProperty(
+        name="Bones",
+        items=[
+            ('CHAINS', "FK Chains", "Bones of every FK/IK chain"),
+            ('SELECTED', "Selected", "Selected pose bones"),
+            ('ALL', "All", "Every bone of the rig"),
+        ],
+        default='CHAINS',
+    )                                                  # type: ignore
+    frame_start: IntProperty(name="Start Frame")       # type: ignore
+    frame_end: IntProperty(name="End Frame")           # type: ignore
+    rig_only: BoolProperty(
+        name="Rig Only",
+        description="Only evaluate the rig and its constraint and driver targets while exporting",
+        default=True,
+    )                                                  # type: ignore
+
+    def get_bone_names(self, context:Context, rig:Object) -> list[str]:
+        if self.bones == 'SELECTED':
+            return [pose_bone.name for pose_bone in context.selected_pose_bones or () if pose_bone.id_data == rig]
+        if self.bones == 'ALL':
+            return list(get_bone_indices(rig))
+        pose_bones = rig.pose.bones
+        chains = get_rig_schema(rig).bone_affect.values()
+        return list({bone_name: None for bones in chains for bone_name in bones if bone_name in pose_bones})
+
+    @profiled
+    def execute(self, context):
+        rig = get_active_ponyrig(context)
+        if rig is None:
+            return {'CANCELLED'}
+        bone_names = self.get_bone_names(context, rig)
+        if not bone_names or self.frame_end < self.frame_start:
+            self.report({'WARNING'}, "Nothing to export, check the bones and the frame range")
+            return {'CANCELLED'}
+
+        export_transform_cache(context, rig, bone_names, self.frame_start, self.frame_end, self.filepath, rig_only=self.rig_only)
+        self.report({'INFO'}, f"Saved {len(bone_names)} bones over {self.frame_end - self.frame_start + 1} frames to '{self.filepath}'.")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.frame_start = context.scene.frame_start
+        self.frame_end = context.scene.frame_end
+        return ExportHelper.invoke(self, context, event)
+
+
+class POSE_OT_ponyrig_cache_import(Operator, ImportHelper):
+    """Key the transforms of a transform cache onto the rig"""
+
+    bl_idname = 'pose.ponyrig_cache_import'
+    bl_label = "Import Transform Cache"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filename_ext = ".ponycache"
+    filter_glob: StringProperty(default="*.ponycache", options={'HIDDEN'}) # type: ignore
+
+    frame_offset: IntProperty(
+        name="Frame Offset",
+        description="Shift the cached frames by this many frames",
+    )                                                  # type: ignore
+
+    @profiled
+    def execute(self, context):
+        rig = get_active_ponyrig(context)
+        if rig is None:
+            return {'CANCELLED'}
+        try:
+            cache = TransformCache.open(self.filepath)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        keyed = import_transform_cache(rig, cache, self.frame_offset)
+        missing = len(cache.bone_indices) - keyed
+        if missing:
+            self.report({'WARNING'}, f"Keyed {keyed} bones, {missing} cached bones aren't in '{rig.name}'")
+        else:
+            self.report({'INFO'}, f"Keyed {keyed} bones over {len(cache.data)} frames")
+        return {'FINISHED'}
+
+
+class POSE_OT_ponyrig_transfer_animation(Operator):
+    """Copy the active rig's action onto the other selected rigs, matching bones by name or through a bone map"""
+
+    bl_idname = 'pose.ponyrig_transfer_animation'
+    bl_label = "Transfer Animation"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    bone_map: StringProperty(
+        name="Bone Map",
+        description="Source bone names mapped to target bone names, as a dict. e.g. {'L_foreLeg_FKJnt1': 'L_arm_FKJnt1'}",
+        default="{}",
+    )                                                  # type: ignore
+    frame_offset: IntProperty(
+        name="Frame Offset",
+        description="Shift the copied keys by this many frames",
+    )                                                  # type: ignore
+    offset_step: IntProperty(
+        name="Offset Per Rig",
+        description="Additional offset for each following target rig, to stagger a crowd",
+    )                                                  # type: ignore
 
+    @profiled
+    def execute(self, context):
+        source = get_active_ponyrig(context)
+        targets = [rig for rig in get_selected_ponyrigs(context) if rig != source]
+        if source is None or not targets:
+            self.report({'WARNING'}, "Select the target rigs and make the source rig active")
+            return {'CANCELLED'}
+
+        try:
+            bone_map = ast.literal_eval(self.bone_map or "{}")
+            if not isinstance(bone_map, dict):
+                raise ValueError("Bone map must be a dict")
+        except (ValueError, SyntaxError) as e:
+            self.report({'ERROR'}, f"Invalid bone map: {e}")
+            return {'CANCELLED'}
+
+        kept = dropped = 0
+        for i, target in enumerate(targets):
+            target_kept, target_dropped = transfer_action(source, target, bone_map, self.frame_offset + i * self.offset_step)
+            kept += target_kept
+            dropped += target_dropped
+
+        if kept == 0 and dropped == 0:
+            self.report({'WARNING'}, f"'{source.name}' has no action")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, f"Copied {kept} curves to {len(targets)} rigs, dropped {dropped} without a matching bone channel")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+
+class POSE_OT_ponyrig_pose_buffer(Operator):
+    """Capture, restore, swap or blend the whole pose of the rig with a stored pose"""
+
+    bl_idname = 'pose.ponyrig_pose_buffer'
+    bl_label = "Pose Buffer"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    action: EnumProperty(
+        name="Action",
+        items=[
+            ('CAPTURE', "Capture", "Store the current pose"),
+            ('RESTORE', "Restore", "Apply the stored pose"),
+            ('SWAP', "Swap", "Apply the stored pose and store the current pose in its place"),
+            ('BLEND', "Blend", "Blend the current pose towards the stored pose"),
+        ],
+    ) # type: ignore
+    slot: EnumProperty(
+        name="Slot",
+        items=[('A', "A", "Pose A"), ('B', "B", "Pose B")],
+    ) # type: ignore
+    factor: FloatProperty(
+        name="Factor", default=0.5, min=0.0, max=1.0, subtype='FACTOR', description="Blend factor towards the stored pose"
+    ) # type: ignore
+    include_properties: BoolProperty(
+        name="Properties", default=True, description="Also restore rig properties such as FK/IK and hinges"
+    ) # type: ignore
+
+    @classmethod
+    def description(cls, context, properties):
+        return f"{properties.action.title()} pose {properties.slot}"
+
+    @profiled
+    def execute(self, context):
+        rig = get_active_ponyrig(context)
+        key = (rig.session_uid, self.slot)
+        stored = _pose_buffers.get(key)
+
+        if self.action == 'CAPTURE':
+            _pose_buffers[key] = PoseBuffer.capture(rig)
+            return {'FINISHED'}
+        if stored is None:
+            self.report({'WARNING'}, f"Pose {self.slot} hasn't been captured yet.")
+            return {'CANCELLED'}
+
+        if self.action == 'RESTORE':
+            stored.restore(rig, properties=self.include_properties)
+        elif self.action == 'SWAP':
+            current = PoseBuffer.capture(rig)
+            stored.restore(rig, properties=self.include_properties)
+            _pose_buffers[key] = current
+        elif self.action == 'BLEND':
+            try:
+                PoseBuffer.capture(rig).blend(stored, self.factor).restore(rig, properties=self.include_properties)
+            except ValueError as e:
+                self.report({'WARNING'}, str(e))
+                return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+
+class WM_OT_ponyrig_profile_reset(Operator):
+    """Clear recorded profiling times and counts"""
+
+    bl_idname = 'wm.ponyrig_profile_reset'
+    bl_label = "Reset Profiling"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        profiler.reset()
+        return {'FINISHED'}
+
+
+class WM_OT_ponyrig_profile_dump(Operator, ExportHelper):
+    """Save recorded profiling events as a JSON trace"""
+
+    bl_idname = 'wm.ponyrig_profile_dump'
+    bl_label = "Save Profiling Trace"
+    bl_options = {'REGISTER'}
+
+    filename_ext = ".json"
+    filter_glob: StringProperty(default="*.json", options={'HIDDEN'}) # type: ignore
+
+    def execute(self, context):
+        profiler.dump(self.filepath)
+        self.report({'INFO'}, f"Saved {len(profiler.trace)} events to '{self.filepath}'.")
         return {'FINISHED'}
 
 
+def update_profiling(self, context):
+    profiler.enabled = self.ponyrig_profile
+    profiler.reset()
+
+
 classes = (
     PonyRig_OutlineItem, 
     PonyRig_RigPreferences, 
+    PonyRig_LODSettings,
     PONY_UL_collections, 
     PONY_PT_MAIN, 
     POSE_OT_snap_bake, 
+    POSE_OT_snap_bake_chains,
     POSE_OT_ponyrig_reset,
+    POSE_OT_ponyrig_reduce_keys,
+    POSE_OT_ponyrig_pose_buffer,
+    POSE_OT_ponyrig_cache_export,
+    POSE_OT_ponyrig_cache_import,
+    POSE_OT_ponyrig_transfer_animation,
     POSE_OT_update_outline_items,
     POSE_OT_ponyrig_keyframe_all_ctrl_bones,
     PONY_PT_bone_collections, 
     PONY_PT_bone_properties,
     PONY_PT_fk_properties,
     PONY_PT_face_properties,
+    PONY_PT_crowd_lod,
     PONY_PT_magic_outline, 
     OBJECT_OT_config_solid_shading, 
+    WM_OT_ponyrig_profile_reset,
+    WM_OT_ponyrig_profile_dump,
+)
+
+
+def sync_rig_registry(depsgraph):
+    if not _rig_registry:
+        return
+    if len(bpy.data.objects) != _rig_registry_object_count:
+        invalidate_rig_registry()
+        return
+    if not depsgraph.id_type_updated('OBJECT'):
+        return
+
+    for update in depsgraph.updates:
+        if not isinstance(update.id, Object) or update.is_updated_transform or update.is_updated_geometry:
+            continue
+        update_rig_registry(update.id.original)
+
+
+def sync_collection_index(depsgraph):
+    if _collection_index_count < 0:
+        return
+    if len(bpy.data.collections) != _collection_index_count:
+        invalidate_collection_index()
+        return
+    if not depsgraph.id_type_updated('COLLECTION'):
+        return
+
+    for update in depsgraph.updates:
+        if isinstance(update.id, Collection):
+            update_collection_index(update.id.original)
+
+
+def sync_outline_items(depsgraph):
+    """Sync outline items of rigs whose outline collection changed"""
+
+    if not depsgraph.id_type_updated('COLLECTION'):
+        return
+
+    updated = {update.id.original for update in depsgraph.updates if isinstance(update.id, Collection)}
+    for rig in get_ponyrigs():
+        outline_coll = get_tagged_collection(get_rig_schema(rig).outline_collection)
+        if outline_coll is None or outline_coll not in updated:
+            continue
+        try:
+            POSE_OT_update_outline_items.run_update(rig, get_rig_schema(rig).outline_collection)
+        except (TypeError, AttributeError):
+            """Linked rig without override"""
+            pass
+
+
+"""Set until outline items were synced with the file, which is done on load or on first draw of the outline panel"""
+_outline_sync_pending = True
+
+
+def sync_all_outline_items():
+    global _outline_sync_pending
+
+    _outline_sync_pending = False
+    for rig in get_ponyrigs():
+        try:
+            POSE_OT_update_outline_items.run_update(rig, get_rig_schema(rig).outline_collection)
+        except (TypeError, AttributeError):
+            """Linked rig without override"""
+            pass
+
+
+def request_outline_sync():
+    """Sync from a timer, panels can't write to ID data while drawing"""
+
+    if not bpy.app.timers.is_registered(sync_all_outline_items):
+        bpy.app.timers.register(sync_all_outline_items, first_interval=0.0)
+
+
+def sync_rig_caches(depsgraph):
+    if not _rig_caches:
+        return
+    if not (depsgraph.id_type_updated('OBJECT') or depsgraph.id_type_updated('ARMATURE')):
+        return
+
+    """
+    Pose edits also report the rig as updated, so the caches are only dropped when their validation key changed.
+    Comparing the key on every update is still far cheaper than rebuilding the caches.
+    """
+    rigs = {}
+    for update in depsgraph.updates:
+        data_id = update.id.original
+        if isinstance(data_id, Object):
+            if data_id.session_uid in _rig_caches:
+                rigs[data_id.session_uid] = data_id
+        elif isinstance(data_id, bpy.types.Armature):
+            for rig in get_ponyrigs():
+                if rig.data == data_id and rig.session_uid in _rig_caches:
+                    rigs[rig.session_uid] = rig
+
+    for rig in rigs.values():
+        validate_rig_caches(rig)
+
+
+@persistent
+def ponyrig_depsgraph_update_post(scene, depsgraph):
+    """Keep cached lookups in sync without rescanning bpy.data on every redraw"""
+
+    sync_rig_registry(depsgraph)
+    sync_collection_index(depsgraph)
+    sync_rig_caches(depsgraph)
+    sync_outline_items(depsgraph)
+
+    if scene.ponyrig_lod.use_lod and depsgraph.id_type_updated('OBJECT'):
+        """Camera or rigs moved"""
+        update_crowd_lod(scene)
+
+
+@persistent
+def ponyrig_frame_change_post(scene, depsgraph=None):
+    update_crowd_lod(scene)
+
+
+@persistent
+def ponyrig_render_init(scene, *args):
+    """Use Render quality on every rig during final renders"""
+
+    settings = scene.ponyrig_lod
+    if not (settings.use_lod and settings.render_quality):
+        return
+    for rig in get_ponyrigs():
+        quality = get_rig_quality(rig)
+        if quality is not None and set_rig_quality(rig, QUALITY_RENDER):
+            _render_quality[rig.name] = quality
+
+
+@persistent
+def ponyrig_render_complete(scene, *args):
+    for rig in get_ponyrigs():
+        if rig.name in _render_quality:
+            set_rig_quality(rig, _render_quality[rig.name])
+    _render_quality.clear()
+
+
+@persistent
+def ponyrig_playback_pre(scene, *args):
+    begin_playback_performance(scene, 'PLAYBACK')
+
+
+@persistent
+def ponyrig_playback_post(scene, *args):
+    end_playback_performance(scene, 'PLAYBACK')
+
+
+@persistent
+def ponyrig_undo_post(*args):
+    """Undo reallocates all data, drop cached references to it"""
+
+    invalidate_rig_registry()
+    invalidate_collection_index()
+    invalidate_rig_caches()
+
+
+@persistent
+def ponyrig_load_post(*args):
+    global _playback_state
+
+    ponyrig_undo_post()
+    _playback_state = None
+    _rig_property_defaults.clear()
+    _compiled_schemas.clear()
+    _pose_buffers.clear()
+    sync_all_outline_items()
+
+
+"""Handlers to register, as (handler list name, function)"""
+handlers = (
+    ('depsgraph_update_post', ponyrig_depsgraph_update_post),
+    ('load_post', ponyrig_load_post),
+    ('undo_post', ponyrig_undo_post),
+    ('redo_post', ponyrig_undo_post),
+    ('frame_change_post', ponyrig_frame_change_post),
+    ('render_init', ponyrig_render_init),
+    ('render_complete', ponyrig_render_complete),
+    ('render_cancel', ponyrig_render_complete),
+    ('animation_playback_pre', ponyrig_playback_pre),
+    ('animation_playback_post', ponyrig_playback_post),
 )
 
 
+def register_handlers():
+    unregister_handlers()
+
+    for handler_name, func in handlers:
+        getattr(bpy.app.handlers, handler_name).append(func)
+    bpy.app.timers.register(poll_scrubbing, first_interval=0.25, persistent=True)
+
+def unregister_handlers():
+    """Remove by name, so handlers left by a previous run of this script are removed as well"""
+
+    for handler_name, func in handlers:
+        handler_list = getattr(bpy.app.handlers, handler_name)
+        for handler in [h for h in handler_list if h.__name__ == func.__name__]:
+            handler_list.remove(handler)
+    for timer in (poll_scrubbing, sync_all_outline_items):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+
+
 def register():
-    unregister()
+    """Only registers types and handlers, rigs are looked up and outline items synced on file load or first draw"""
+    global _outline_sync_pending
+
+    if hasattr(Object, "ponyrig_prefs"):
+        """Script run again without unregistering"""
+        unregister()
 
     for cls in classes:
         bpy.utils.register_class(cls)
+    register_handlers()
 
     Object.ponyrig_prefs = PointerProperty(type=PonyRig_RigPreferences, override={'LIBRARY_OVERRIDABLE'})
-    if get_ponyrig():
-        try:
-            POSE_OT_update_outline_items.run_update(get_ponyrig(), collction_id='outline_master')
-        except TypeError:
-            """happens when object is link type"""
-            pass
+    Scene.ponyrig_lod = PointerProperty(type=PonyRig_LODSettings)
+    Scene.ponyrig_playback_performance = BoolProperty(
+        name="Playback Performance",
+        description="Use Performance quality, hide magic and outlines and disable expensive modifiers during playback and scrubbing",
+        update=update_playback_performance,
+    )
+    WindowManager.ponyrig_profile = BoolProperty(
+        name="Profile",
+        description="Record draw time of each PonyRig panel, run time of operators and counts of rig lookups",
+        update=update_profiling,
+    )
+    _outline_sync_pending = True
 
 def unregister():
+    global _playback_state
+
+    unregister_handlers()
+    if _playback_state is not None:
+        _playback_state, state = None, _playback_state
+        state.restore()
+
     for cls in classes:
         try:
             bpy.utils.unregister_class(cls)
@@ -931,6 +3826,19 @@ def unregister():
         del bpy.types.Object.ponyrig_prefs
     except AttributeError:
         pass
+    try:
+        del bpy.types.WindowManager.ponyrig_profile
+    except AttributeError:
+        pass
+    try:
+        del bpy.types.Scene.ponyrig_lod
+    except AttributeError:
+        pass
+    try:
+        del bpy.types.Scene.ponyrig_playback_performance
+    except AttributeError:
+        pass
+    profiler.enabled = False
 
 
 if __name__ == '__main__':